@@ -76,6 +76,19 @@ def parse():
                                         help='File with license compatibility matrix, defaults to osadl-matrix database',
                                         default=flict_config.DEFAULT_MATRIX_FILE)
 
+    commmon_defaults_group.add_argument('--license-matrix-overlay-file', '-lmof',
+                                        type=str,
+                                        action='append',
+                                        dest='license_matrix_overlay_files',
+                                        help='File (JSON) with additional licenses to put on top of the license compatibility matrix. Can be given more than once, later files override earlier',
+                                        default=None)
+
+    commmon_defaults_group.add_argument('--overlay-default-no', '-odn',
+                                        action='store_true',
+                                        dest='overlay_default_no',
+                                        help='If no compatibility can be found in the matrix or overlays, "No" compatibility is assumed',
+                                        default=False)
+
     commmon_defaults_group.add_argument('--licenses-denied-file', '-ldf', type=str, dest='licenses_denied_file', help='', default=None)
 
     commmon_defaults_group.add_argument('--licenses-allowed-file', '-laf', type=str, dest='licenses_allowed_file', help='', default=None)
@@ -98,6 +111,13 @@ def parse():
                         help='Check all supported licenes when trying to find an outbound license',
                         default=False)
 
+    # COMMON
+    parser.add_argument('-sc', '--short-circuit',
+                        action='store_true',
+                        dest='short_circuit',
+                        help='stop checking the operands of AND/OR once the compatibility is decided, remaining operands are marked "Not evaluated"',
+                        default=False)
+
     # COMMON
     parser.add_argument('-nr', '--no-relicense',
                         action='store_true',
@@ -146,6 +166,8 @@ def parse():
                                    default=False)
 
     subparsers = parser.add_subparsers(help='Sub commands')
+    # only verify has --jobs, but all commands create an arbiter
+    parser.set_defaults(jobs=1)
 
     # verify
     parser_v = subparsers.add_parser(
@@ -156,6 +178,9 @@ def parse():
     parser_v.add_argument('--sbom', '-s', type=str, dest='verify_sbom', help='SBoM file to verify')
     parser_v.add_argument('--sbom-dirs', '-sd', type=str, nargs='+', dest='sbom_dirs', help='Directories where SBoM files are searched for.', default='.')
     parser_v.add_argument('--flict', '-f', type=str, dest='verify_flict', help='Flict project file to verify')
+    parser_v.add_argument('--previous', '-pr', type=str, dest='previous_report', help='Previous verification report (JSON) of the project, packages unchanged since are not verified again', default=None)
+    parser_v.add_argument('--quick', '-q', action='store_true', dest='quick', help='Only return the verdict, as exit code, without creating a report', default=False)
+    parser_v.add_argument('--jobs', '-j', type=int, dest='jobs', help='Number of processes verifying the packages in parallel, 0 for one per CPU (default 1)', default=1)
 
     parser_v.add_argument('--manifest-file', '-mf', type=str,
                           help='verify license compatibility for project in manifest file')
@@ -167,6 +192,13 @@ def parse():
     parser_si.add_argument('license_expression', type=str, nargs='+',
                            help='License expression to simplify')
 
+    # normalize
+    parser_no = subparsers.add_parser(
+        'normalize', help='Normalize license expressions, e.g. GPLv2 -> GPL-2.0-only. Reads one expression per line from stdin if none are given')
+    parser_no.set_defaults(which="normalize", func=normalize)
+    parser_no.add_argument('license_expression', type=str, nargs='*',
+                           help='License expressions to normalize')
+
     # list
     parser_li = subparsers.add_parser(
         'list', help='List supported licenses')
@@ -181,6 +213,25 @@ def parse():
     merge_parser.add_argument('--license-file', '-lf', type=str, dest='license_file', help='License file (JSON) to merge', default=None)
     merge_parser.add_argument('--default-no', '-dn', action='store_true', dest='default_no', help='If no compatibility can be found in the additional matrix, "No" compatibility is assumed. Works only for JSON input matrix', default=False)
 
+    # compile-matrix
+    parser_cm = subparsers.add_parser(
+        'compile-matrix', help='Compile the license matrix (see --license-matrix-file) to a binary file, for use with --license-matrix-file')
+    parser_cm.set_defaults(which="compile-matrix", func=compile_matrix)
+    parser_cm.add_argument('--compiled-matrix-file', '-cmf', type=str, dest='compiled_matrix_file', help='File to store the compiled matrix in', required=True)
+
+    # validate-matrix
+    parser_vm = subparsers.add_parser(
+        'validate-matrix', help='Validate the completeness of the license matrix (see --license-matrix-file), with overlays, and report all missing compatibilities')
+    parser_vm.set_defaults(which="validate-matrix", func=validate_matrix)
+
+    # diff-matrix
+    parser_dm = subparsers.add_parser(
+        'diff-matrix', help='List the compatibilities that differ between two license matrices, and the packages in verification reports that may be affected')
+    parser_dm.set_defaults(which="diff-matrix", func=diff_matrix)
+    parser_dm.add_argument('--old-matrix-file', '-omf', type=str, dest='old_matrix_file', help='File with the old license matrix', required=True)
+    parser_dm.add_argument('--new-matrix-file', '-nmf', type=str, dest='new_matrix_file', help='File with the new license matrix, defaults to --license-matrix-file', default=None)
+    parser_dm.add_argument('--reports', '-r', type=str, nargs='+', dest='report_files', help='Verification reports (JSON, as created by verify) to find affected packages in', default=[])
+
     # display-compatibility
     parser_d = subparsers.add_parser(
         'display-compatibility', help='Display license compatibility graphically')
@@ -237,20 +288,46 @@ def simplify(args):
     flict_print(args, ret)
 
 
+def normalize(args):
+    ret = FlictImpl(args).normalize()
+    flict_print(args, ret)
+
+
 def _merge_licenses(args):
     file_sanity_check(args.license_file)
     ret = FlictImpl(args).merge_license_db()
     flict_print(args, ret)
 
 
+def compile_matrix(args):
+    file_sanity_check(args.license_matrix_file)
+    FlictImpl(args).compile_matrix()
+
+
+def validate_matrix(args):
+    file_sanity_check(args.license_matrix_file)
+    data, code = FlictImpl(args).validate_matrix()
+    flict_print(args, data)
+    return code
+
+
+def diff_matrix(args):
+    file_sanity_check(args.old_matrix_file)
+    ret = FlictImpl(args).diff_matrix()
+    flict_print(args, ret)
+
+
 def list_licenses(args):
     ret = FlictImpl(args).list_licenses()
     flict_print(args, ret)
 
 
 def verify(args):
+    if args.previous_report:
+        file_sanity_check(args.previous_report)
     data, code = FlictImpl(args).verify()
-    flict_print(args, data)
+    if data is not None:
+        flict_print(args, data)
     return code
 
 
@@ -2,46 +2,93 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import concurrent.futures
+import itertools
+import json
 import logging
+import os
 
+from flict.flictlib.disk_cache import cache_key
+from flict.flictlib.flict_config import flict_version
 from flict.flictlib.lic_comp import LicenseCompatibilty
 from flict.flictlib.project.reader import Project
+from flict.flictlib.utils import compatibility_index
 from flict.flictlib.utils import meta_information
+from flict.flictlib.utils import outbound_compatibility
 from flict.flictlib.utils import timestamp
 from flict.flictlib.return_codes import FlictError, ReturnCodes
 from flict.flictlib.license import compatible_license_short
+from flict.flictlib.license import normalize_licenses
 from flict.flictlib.project.reader import FlictProjectReader
 
 
+# the arbiter, and its checks made, in a verify worker process, see
+# Arbiter.verify
+_worker_arbiter = None
+_worker_results = None
+
+
+def _init_verify_worker(arbiter_args):
+    global _worker_arbiter, _worker_results
+    _worker_arbiter = Arbiter(**arbiter_args)
+    _worker_results = {}
+
+
+def _verify_package_worker(package, supplied_licenses):
+    return _worker_arbiter._verify_project_package(package, supplied_licenses, _worker_results)
+
+
 class Arbiter:
     """Arbiter is a class to verify compatibility"""
 
-    def __init__(self, license_db=None, licenses_preferences=None, denied_licenses=None, allowed_licenses=None, update_dual=True):
+    def __init__(self, license_db=None, licenses_preferences=None, denied_licenses=None, allowed_licenses=None, update_dual=True,
+                 license_db_overlays=None, overlay_default_no=False, short_circuit=False, jobs=1):
         """Initializes Arbiter objects
              Parameters:
                  license_db: license database to use instead of builtin
                  licenses_preferences: license preferences to use instead of builtin
                  denied_licenses: licenses that cannot be used
                  allowed_licenses: licenses that are the only ones to be used
+                 license_db_overlays: files with additional licenses, put on top of the license database
+                 overlay_default_no: assume "No" compatibility when missing in license database and overlays
+                 short_circuit: stop evaluating AND/OR operands once the result is decided
+                 jobs: number of processes verifying a project's packages, 0 for one per CPU
         """
         self.update_dual = update_dual
+        self.jobs = jobs or os.cpu_count()
+        # to create identical arbiters in the verify worker processes
+        self._arbiter_args = {
+            'license_db': license_db, 'licenses_preferences': licenses_preferences, 'denied_licenses': denied_licenses,
+            'allowed_licenses': allowed_licenses, 'update_dual': update_dual, 'license_db_overlays': license_db_overlays,
+            'overlay_default_no': overlay_default_no, 'short_circuit': short_circuit,
+        }
         self.license_compatibility = LicenseCompatibilty(
-            license_db=license_db, licenses_preferences=licenses_preferences, denied_licenses=denied_licenses, allowed_licenses=allowed_licenses, update_dual=update_dual)
+            license_db=license_db, licenses_preferences=licenses_preferences, denied_licenses=denied_licenses, allowed_licenses=allowed_licenses, update_dual=update_dual,
+            license_db_overlays=license_db_overlays, overlay_default_no=overlay_default_no, short_circuit=short_circuit)
 
     def supported_licenses(self):
         """Returns the supported licenses"""
         return self.license_compatibility.supported_licenses()
 
+    def cache_statistics(self):
+        """Returns hits, misses and evictions of the compatibility cache"""
+        return self.license_compatibility.cache_statistics()
+
+    def license_cache_statistics(self):
+        """Returns hits, misses and evictions of the license (parse) cache"""
+        return self.license_compatibility.license_cache_statistics()
+
     def license_allowed(self, lic):
         """Return whether or not a license is allowed"""
         return self.license_compatibility.license.license_allowed(lic)
 
-    def _verify_package(self, package, licenses):
+    def _verify_package(self, package, licenses, results=None):
         """Verifies a package's license to a list of outbounds and returns the
         compatibility between the liceses.
              Parameters:
                  package: the package (with its license) to check for compatibility
                  licenses: the licenses to check the package's license against
+                 results: dict with the checks, and their problems, already made keyed by (inbound, outbound) license
         """
         logging.debug(f"* verify package {package['name']} (\"{package['license']}\"")
 
@@ -49,16 +96,27 @@ class Arbiter:
         inbound_license = package['license']
         logging.debug(f"   * Inbound license:  {inbound_license}")
 
+        results = {} if results is None else results
+        compiled = None
         checks = []
         problems = []
         for outbound_license in licenses:
-            check = self.inbounds_outbound_check(outbound_license, [inbound_license])
-            problems += check.get('problems', [])
-            checks.append(check)
+            # packages with the same license share the check, so each
+            # (inbound, outbound) pair is evaluated only once
+            key = (inbound_license, outbound_license)
+            result = results.get(key)
+            if result is None:
+                # parse the inbound license once, evaluate it for every outbound
+                if compiled is None:
+                    compiled = self.license_compatibility.compile_expression([inbound_license])
+                check = self.license_compatibility.evaluate_expression(outbound_license, compiled)
+                result = results[key] = (check.to_dict(), check.problems)
+            checks.append(result[0])
+            problems += result[1]
 
         return checks, problems
 
-    def verify_outbound_inbound(self, outbound, inbound):
+    def _outbound_inbound_project(self, outbound, inbound):
         # Use that flict can calculate license compatibility for a
         # project by creating an dummy project - with outer project
         # (outbound license) and one simple dependency (inbound
@@ -81,7 +139,11 @@ class Arbiter:
         reader = FlictProjectReader([])
         dummy_project = reader.read_project_data(dummy_project_data)
         compat_outbound = compatible_license_short(' '.join(outbound), self.update_dual)
-        verification = self.verify(dummy_project, [compat_outbound])
+        return dummy_project, [compat_outbound]
+
+    def verify_outbound_inbound(self, outbound, inbound):
+        dummy_project, supplied_licenses = self._outbound_inbound_project(outbound, inbound)
+        verification = self.verify(dummy_project, supplied_licenses)
 
         package = verification['packages'][0]
         dependency = package['dependencies'][0]
@@ -101,73 +163,30 @@ class Arbiter:
         }
 
     def _package_info_compatibility(self, package_info, outbound):
-        for compat in package_info['compatibility']:
-            logging.debug(f"            *** outbound: \"{compat['outbound']}\"  <--->  \"{compat}\"")
-
-            if compat['outbound']['name'] == outbound:
-                logging.debug("         *** found outbound in compats")
-
-                allowed = compat['allowed']
-                compatibility = compat['compatibility']
-                compatible = compatibility == "Yes"
-                name = compat['name']
-                logging.debug(f"         *** type:          {type}")
-                logging.debug(f"         *** allowed:       {allowed}")
-                logging.debug(f"         *** compatibility: {compatibility}")
-                logging.debug(f"         *** compatible:    {compatible}")
-                logging.debug(f"         *** name:          {name}")
-
-                return (compatible, compat['name'])
-
-        return (False, None)
-
-    def _combined_work_compatible_dependencies(self, outbound_license, dep_infos):
-        compatible = True
-
-        for dep_info in dep_infos:
-            # Get the corresponding compatiblity for outbound_license for dep_info
-            compatible_license = self._package_info_compatibility(dep_info, outbound_license)
-            dep_compatible = compatible_license[0]
-            compatible = compatible and dep_compatible
-            logging.debug("        {dep_info['name']}: {dep_compatible} ===> {compatible}")
-        return compatible
-
-    def _combined_work_compatible(self, outbound_license, package_info, dep_infos):
-        compatible_license = self._package_info_compatibility(package_info, outbound_license)
-        if not compatible_license:
-            raise FlictError(ReturnCodes.RET_INTERNAL_ERROR,
-                             f"Found license incompatibility for \"{package_info}\", \"{outbound_license}\"")
-        else:
-            compatible = compatible_license[0]
-
-        # AND together compatible status from dependencies
-        compatible = compatible and self._combined_work_compatible_dependencies(outbound_license, dep_infos)
-
-        logging.debug(f"    --> combined work compatible: {compatible}\n")
-        return compatible
+        compat = outbound_compatibility(package_info, outbound)
+        if compat is None:
+            return (False, None)
+        return (compat['compatibility'] == "Yes", compat['name'])
 
     def _top_package_license(self, all_licenses, package_info, dep_infos):
-        outbound_licenses = set()
         logging.debug("TOP LEVEL OUTBOUND")
         #
-        # Start with checking top package's license as outbound
-        #
-        compatible = self._combined_work_compatible(package_info['license'], package_info, dep_infos)
-        if compatible:
-            outbound_licenses.add(package_info['license'])
-
-        #
-        # Let's loop through all the other licenses in the combined work
+        # Check the top package's license and all the other licenses
+        # in the combined work as outbound. An outbound license can be
+        # used for the combined work if the package and all the
+        # dependencies are compatible with it, i.e. the intersection
+        # of the packages' compatible outbound licenses.
         #
-        for lic in all_licenses:
-            compatible = self._combined_work_compatible(lic, package_info, dep_infos)
-            if compatible:
-                outbound_licenses.add(lic)
+        compatible_bits = self.license_compatibility.expression_outbound_bits([package_info['license']])
+        for dep_info in dep_infos:
+            compatible_bits &= self.license_compatibility.expression_outbound_bits([dep_info['license']])
 
-        return list(outbound_licenses)
+        outbound_licenses = self.license_compatibility.bits_licenses(compatible_bits & self.license_compatibility.license_bits(all_licenses))
+        logging.debug(f"    --> combined work compatible: {outbound_licenses}\n")
+        return outbound_licenses
 
-    def _package_info(self, package, licenses):
-        compats, problems = self._verify_package(package, licenses)
+    def _package_info(self, package, licenses, results=None):
+        compats, problems = self._verify_package(package, licenses, results)
         return {
             'name': package['name'],
             'license': package.get('license'),
@@ -177,62 +196,191 @@ class Arbiter:
             'version': package['version'],
             'description': package.get('description', ""),
             'compatibility': compats,
+            'compatibility_index': compatibility_index(compats),
             'problems': list(set(problems)),
         }
 
-    def verify(self, project, supplied_licenses=None):
+    def _licenses_to_check(self, package, supplied_licenses):
+        if supplied_licenses is None:
+            return self.license_compatibility.licenses(Project.combined_work_license(package))
+        return self.license_compatibility.licenses(' '.join(supplied_licenses))
+
+    def _verify_project_package(self, package, supplied_licenses, results):
+        """Verifies a package, and its dependencies, of a project and returns
+        the package info and the licenses checked
+             Parameters:
+                 package: the package (with its dependencies) to check for compatibility
+                 supplied_licenses: the licenses to check the package's license against
+                 results: checks already made, see _verify_package
+        """
+        licenses = self._licenses_to_check(package, supplied_licenses)
+
+        package_info = self._package_info(package, licenses, results)
+
+        dep_infos = [self._package_info(dep, licenses, results) for dep in package.get('dependencies', [])]
+        dep_problems = [problem for dep_info in dep_infos for problem in dep_info['problems']]
+
+        # Get a list of the outbound licenses for all packages
+        outbound_licenses = self._top_package_license(licenses, package_info, dep_infos)
+
+        allowed_outbound_licenses = [ol for ol in outbound_licenses if self.license_compatibility.license.license_allowed(ol)]
+
+        # Identify single outbound (chosen) license (from the aliased outbound licenses)
+        chosen_license = self.license_compatibility.choose_license(allowed_outbound_licenses)
+
+        package_info.update({
+            'dependencies': dep_infos,
+            'dependency_problems': list(set(dep_problems)),
+            'outbound_licenses': outbound_licenses,
+            'allowed_outbound_licenses': allowed_outbound_licenses,
+            'outbound_license': chosen_license,
+        })
+        return package_info, licenses
+
+    def _verify_project_packages(self, packages, supplied_licenses):
+        if self.jobs <= 1 or len(packages) <= 1:
+            # checks made, keyed by (inbound, outbound) license, see _verify_package
+            results = {}
+            return [self._verify_project_package(package, supplied_licenses, results) for package in packages]
+
+        # Split the packages over a pool of processes, each with an
+        # arbiter created once. map returns the results in the order
+        # of the packages, so the report is the same as when verified
+        # in one process.
+        jobs = min(self.jobs, len(packages))
+        chunksize = max(1, len(packages) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_verify_worker, initargs=(self._arbiter_args,)) as executor:
+            return list(executor.map(_verify_package_worker, packages, itertools.repeat(supplied_licenses), chunksize=chunksize))
+
+    def verification_digests(self, supplied_licenses=None):
+        """Returns the digests of what, apart from the project, a verification
+        depends on: the license matrix (with overlays) and the policy, i.e.
+        the denied, allowed and preferred licenses and the settings.
+        They are stored in the report's meta information, see verify.
+             Parameters:
+                 supplied_licenses: the licenses to check the packages' licenses against
+        """
+        policy = {key: self._arbiter_args[key] for key in ['licenses_preferences', 'denied_licenses', 'allowed_licenses', 'update_dual', 'short_circuit']}
+        policy['supplied_licenses'] = supplied_licenses
+        return {
+            'matrix_digest': self.license_compatibility.compatibility.matrix.digest(),
+            'policy_digest': cache_key(flict_version, json.dumps(policy, sort_keys=True)),
+        }
+
+    @staticmethod
+    def _package_signature(package):
+        # what a package info is created from, see _package_info
+        return (package['name'], package['version'], package.get('license'), package.get('original_license'),
+                package.get('license_details', ""), package.get('description', ""))
+
+    def _previous_package_infos(self, previous, digests):
+        """Returns the package infos, keyed by package signature, in a
+        previous verification report. If the report was made with another
+        license matrix or policy no package infos are returned."""
+        meta = previous.get('meta', {})
+        if any(meta.get(key) != digest for key, digest in digests.items()):
+            logging.debug("previous report made with another license matrix or policy, verifying all packages")
+            return {}
+        try:
+            return {self._package_signature(package_info): package_info for package_info in previous['packages']}
+        except (KeyError, TypeError):
+            raise FlictError(ReturnCodes.RET_INVALID_PROJECT, 'The previous report is not a verification report')
+
+    def _previous_package_info(self, package, previous_infos):
+        """Returns the package info from the previous report if the package
+        and its dependencies are unchanged, else None"""
+        package_info = previous_infos.get(self._package_signature(package))
+        if package_info is None:
+            return None
+        dependencies = [self._package_signature(dep) for dep in package.get('dependencies', [])]
+        if dependencies != [self._package_signature(dep) for dep in package_info['dependencies']]:
+            return None
+
+        # reports made before the compatibility index was added
+        for info in [package_info] + package_info['dependencies']:
+            info.setdefault('compatibility_index', compatibility_index(info['compatibility']))
+        return package_info
+
+    def verify(self, project, supplied_licenses=None, previous=None):
         """Verifies a project's license to a list of outbounds and returns the
         compatibility between the liceses.
              Parameters:
                  project: the project (with its packages and their licenses) to check for compatibility
                  supplied_licenses: the licenses to check the package's license against
+                 previous: a previous verification report (dict) of the project. Packages, with
+                           dependencies, that are unchanged are copied from it instead of verified,
+                           unless the license matrix or policy changed
         """
         start_time = timestamp()
 
         project_name = project['project_name']
+        digests = self.verification_digests(supplied_licenses)
+
+        previous_infos = self._previous_package_infos(previous, digests) if previous else {}
+        previous_package_infos = [self._previous_package_info(package, previous_infos) for package in project['packages']]
+        to_verify = [package for package, previous_info in zip(project['packages'], previous_package_infos) if previous_info is None]
+        logging.debug(f"verifying {len(to_verify)} packages, {len(previous_package_infos) - len(to_verify)} unchanged since the previous report")
+        verified = iter(self._verify_project_packages(to_verify, supplied_licenses))
 
         package_infos = []
         all_licenses = set()
 
-        for package in project['packages']:
-            license_expression = Project.combined_work_license(package)
-
-            if supplied_licenses is None:
-                licenses = self.license_compatibility.licenses(license_expression)
+        for previous_info in previous_package_infos:
+            if previous_info is None:
+                package_info, licenses = next(verified)
             else:
-                licenses = self.license_compatibility.licenses(' '.join(supplied_licenses))
-
+                package_info, licenses = previous_info, previous_info['licenses_to_check']
             all_licenses.update(licenses)
-
-            package_info = self._package_info(package, licenses)
-
-            dep_infos = [self._package_info(dep, licenses) for dep in package.get('dependencies', [])]
-            dep_problems = [problem for dep_info in dep_infos for problem in dep_info['problems']]
-
-            # Get a list of the outbound licenses for all packages
-            outbound_licenses = self._top_package_license(licenses, package_info, dep_infos)
-
-            allowed_outbound_licenses = [ol for ol in outbound_licenses if self.license_compatibility.license.license_allowed(ol)]
-
-            # Identify single outbound (chosen) license (from the aliased outbound licenses)
-            chosen_license = self.license_compatibility.choose_license(allowed_outbound_licenses)
-
-            package_info.update({
-                'dependencies': dep_infos,
-                'dependency_problems': list(set(dep_problems)),
-                'outbound_licenses': outbound_licenses,
-                'allowed_outbound_licenses': allowed_outbound_licenses,
-                'outbound_license': chosen_license,
-            })
             package_infos.append(package_info)
 
+        meta = meta_information(start_time)
+        meta.update(digests)
         return {
             "project_name": project_name,
             "packages": package_infos,
-            "meta": meta_information(start_time),
+            "meta": meta,
             "all_licenses": list(all_licenses),
         }
 
+    def verify_verdict(self, project, supplied_licenses=None, check_problems=True):
+        """Returns the verdict of verifying a project, without creating a
+        report: whether every package has an allowed outbound license
+        ('compatible') and the problems found ('problems'). This gives the
+        same result as checking the allowed outbound licenses and the
+        problems of the packages in the report from verify, but stops at
+        the first package with problems or, if problems are not checked,
+        at the first package without an allowed outbound license.
+             Parameters:
+                 project: the project (with its packages and their licenses) to check for compatibility
+                 supplied_licenses: the licenses to check the package's license against
+                 check_problems: look for problems, e.g. unknown compatibilities
+        """
+        compatible = True
+        for package in project['packages']:
+            licenses = self._licenses_to_check(package, supplied_licenses)
+            dependencies = package.get('dependencies', [])
+
+            if check_problems:
+                problems = set()
+                for _package in [package] + dependencies:
+                    problems.update(self.license_compatibility.expression_problems([_package['license']], licenses))
+                if problems:
+                    return {'compatible': False, 'problems': sorted(problems)}
+
+            if compatible:
+                outbound_licenses = self._top_package_license(licenses, package, dependencies)
+                compatible = any(self.license_compatibility.license.license_allowed(ol) for ol in outbound_licenses)
+                if not compatible and not check_problems:
+                    break
+
+        return {'compatible': compatible, 'problems': []}
+
+    def verify_outbound_inbound_verdict(self, outbound, inbound, check_problems=True):
+        """Returns the verdict, see verify_verdict, of verifying an outbound
+        license against an inbound license, as verify_outbound_inbound"""
+        dummy_project, supplied_licenses = self._outbound_inbound_project(outbound, inbound)
+        return self.verify_verdict(dummy_project, supplied_licenses, check_problems)
+
     def _compat_ok_to_use(self, compat):
         """
         Checks if a compatibility is OK to use by checking if
@@ -249,6 +397,31 @@ class Arbiter:
         """
         return self.license_compatibility.inbounds_outbound_compatibility(outbound, expr)
 
+    def compile_expression(self, expr):
+        """Compile an inbound license expression, to be checked against
+        several outbound licenses with evaluate_expression
+             Parameters:
+                 expr: license expr with inbound license (e.g. ["MPL-2.0 OR MIT"])
+        """
+        return self.license_compatibility.compile_expression(expr)
+
+    def compatible_outbounds(self, expr, outbounds=None):
+        """Returns the outbound licenses an inbound license expression is compatible with
+             Parameters:
+                 expr: license expr with inbound license (e.g. ["MPL-2.0 OR MIT"])
+                 outbounds: outbound licenses to consider, all supported licenses if None
+        """
+        return self.license_compatibility.expression_compatible_outbounds(expr, outbounds)
+
+    def evaluate_expression(self, outbound, compiled):
+        """Check an outbound license against a compiled inbound license expression
+             Parameters:
+                 outbound: the outbound license (e.g. "GPL-2.0-only")
+                 compiled: compiled license expr, from compile_expression
+             Returns a tree of checks, use to_dict() to get the same as from inbounds_outbound_check
+        """
+        return self.license_compatibility.evaluate_expression(outbound, compiled)
+
     def inbound_outbound_check(self, outbound, inbound):
         """Check an outbound license against an inbound license
              Parameters:
@@ -264,6 +437,13 @@ class Arbiter:
     def extend_license_db(self, file_name, oformat="JSON", default_no=False):
         return self.license_compatibility.extend_license_db(file_name, oformat, default_no)
 
+    def validate_license_db(self):
+        """Validates the completeness of the license db and returns a report"""
+        return self.license_compatibility.validate_license_db()
+
+    def compile_license_db(self, file_name):
+        return self.license_compatibility.compile_license_db(file_name)
+
     def simplify_license(self, expr):
         return self.license_compatibility.simplify_license(expr)
 
@@ -275,3 +455,12 @@ class Arbiter:
 
     def license_compatibility_as(self, expr):
         return compatible_license_short(expr)
+
+    def normalize_licenses(self, exprs):
+        """Returns a dict with the normalized form of each distinct license
+        expression, see license.normalize_licenses
+
+        Parameters:
+            exprs - license expressions (list of str)
+        """
+        return normalize_licenses(exprs, update_dual=self.update_dual)
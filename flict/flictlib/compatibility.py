@@ -8,6 +8,17 @@ import logging
 from enum import Enum
 import osadl_matrix
 
+from flict.flictlib import flict_config
+from flict.flictlib.disk_cache import cache_key, read_cache, write_cache
+from flict.flictlib.lru_cache import LRUCache
+from flict.flictlib.matrix import is_compiled_matrix
+from flict.flictlib.matrix import license_ranking
+from flict.flictlib.matrix import load_matrix
+from flict.flictlib.matrix import read_matrix_data
+from flict.flictlib.matrix import read_overlay
+from flict.flictlib.matrix import validate_matrix_data
+from flict.flictlib.matrix import numpy
+from flict.flictlib.matrix import MATRIX_CHECKDEP, MATRIX_NO, MATRIX_UNDEFINED, MATRIX_UNKNOWN, MATRIX_YES
 from flict.flictlib.return_codes import FlictError, ReturnCodes
 
 class CompatibilityStatus(Enum):
@@ -16,27 +27,49 @@ class CompatibilityStatus(Enum):
     LICENSE_COMPATIBILITY_UNKNOWN = "Unknown"
     LICENSE_COMPATIBILITY_MANUALLY_CHECK = "Check dependencies manually"
     LICENSE_COMPATIBILITY_UNDEFINED = "Undefined"
+    LICENSE_COMPATIBILITY_NOT_EVALUATED = "Not evaluated"
 
 
 LICENSE_COMPATIBILITY_AND = "AND"
 LICENSE_COMPATIBILITY_OR = "OR"
 COMPATIBILITY_TAG = "compatibility"
 
+MATRIX_CODE_STATUS = {
+    MATRIX_UNDEFINED: CompatibilityStatus.LICENSE_COMPATIBILITY_UNDEFINED.value,
+    MATRIX_YES: CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value,
+    MATRIX_NO: CompatibilityStatus.LICENSE_COMPATIBILITY_INCOMPATIBLE.value,
+    MATRIX_UNKNOWN: CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value,
+    MATRIX_CHECKDEP: CompatibilityStatus.LICENSE_COMPATIBILITY_MANUALLY_CHECK.value,
+}
+
+
+class CompatibilityCache(LRUCache):
+    """Bounded LRU cache for compatibility results."""
+
+    def __init__(self, maxsize=flict_config.DEFAULT_COMPATIBILITY_CACHE_SIZE):
+        super(CompatibilityCache, self).__init__(maxsize)
+
+
+# results from check_compat, keyed by (outbound, inbound, license db and overlays)
+compatibility_cache = CompatibilityCache()
+
 
 class CompatibilityFactory:
     """Class to provide Compatibility objects via get_compatibility
     """
 
     @staticmethod
-    def get_compatibility(license_db=None):
+    def get_compatibility(license_db=None, license_db_overlays=None, default_no=False):
         """Returns a Compatibility object.
 
             Parameters:
                 licensedb: licensedb to use if not using default
+                license_db_overlays: files with additional licenses to put on top of licensedb
+                default_no: assume No for compatibilities not in licensedb or overlays
 
         Currently only OsadlCompatibility is available.
         """
-        return OsadlCompatibility(license_db)
+        return OsadlCompatibility(license_db, license_db_overlays, default_no)
 
 
 class Compatibility:
@@ -45,15 +78,48 @@ class Compatibility:
     This class need to be implemented in sub classes.
     """
 
-    def __init__(self, license_db=None):
-        pass
+    def __init__(self, license_db=None, license_db_overlays=None, default_no=False):
+        self.license_db = license_db
+        self.license_db_overlays = license_db_overlays or []
+        self.license_db_key = (license_db, tuple(self.license_db_overlays), default_no)
 
     def check_compat(self, outbound, inbound):
+        """Returns the compatibility between outbound and inbound.
+
+        The results are cached (see CompatibilityCache) and shared, so
+        the returned dict must not be modified."""
+        key = (outbound, inbound, self.license_db_key)
+        result = compatibility_cache.get(key)
+        if result is None:
+            result = self._check_compat(outbound, inbound)
+            compatibility_cache.put(key, result)
+        return result
+
+    def _check_compat(self, outbound, inbound):
         return None
 
+    def cache_statistics(self):
+        return compatibility_cache.statistics()
+
     def supported_licenses(self):
         return None
 
+    def compatible_inbounds(self, outbound):
+        """Returns a bitset (int) of the inbound licenses compatible with outbound"""
+        return None
+
+    def compatible_outbounds(self, inbounds):
+        """Returns a bitset (int) of the outbound licenses compatible with all the inbounds"""
+        return None
+
+    def license_bits(self, licenses):
+        """Returns a bitset (int) of licenses"""
+        return None
+
+    def bits_licenses(self, bits):
+        """Returns a list of licenses in the bitset bits"""
+        return None
+
     def display_compatibility(self):
         try:
             # build up license string from all expressions
@@ -90,8 +156,6 @@ class Compatibility:
 
     def check_compatibilities(self, licenses, check_all=False):
         """Check compatbilitiy between supplied licenses"""
-        compats = []
-
         if check_all:
             supported = self.supported_licenses()
             if 'Compatibility' in supported:
@@ -100,26 +164,14 @@ class Compatibility:
             licenses_set = set(licenses + supported)
             outer_licenses = list(licenses_set)
         else:
-            outer_licenses = set(licenses)
-
-        for lic_a in outer_licenses:
-            inner_licenses = []
-            for lic_b in licenses:
-
-                comp_left = self.check_compat(lic_a, lic_b)['compatibility']
-                comp_right = self.check_compat(lic_b, lic_a)['compatibility']
-
-                if CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value in (comp_left, comp_right):
+            outer_licenses = list(set(licenses))
 
-                    supported = self.supported_licenses()
-                    lic_bad = ",".join({lic for lic in (lic_a, lic_b) if lic not in supported})
-                    if lic_bad != "":
-                        raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
-                                         f'License expression "{lic_bad}" is not supported.')
-                    else:
-                        raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
-                                         f'Licenses "{lic_a}" and "{lic_b}" do not have known compatibility both ways.')
+        lefts, rights = self._compatibility_statuses(outer_licenses, licenses)
 
+        compats = []
+        for lic_a, left_row, right_row in zip(outer_licenses, lefts, rights):
+            inner_licenses = []
+            for lic_b, comp_left, comp_right in zip(licenses, left_row, right_row):
                 inner_licenses.append({
                     'license': lic_b,
                     'compatible_right': self._compatibility_status_json(comp_right),
@@ -135,6 +187,40 @@ class Compatibility:
             'compatibilities': compats,
         }
 
+    def _compatibility_statuses(self, outer_licenses, inner_licenses):
+        """Returns the compatibility statuses, both ways, between the
+        outer and inner licenses as two lists (outer) of lists (inner):
+            left  - outer license as outbound, inner license as inbound
+            right - inner license as outbound, outer license as inbound
+        """
+        lefts = []
+        rights = []
+        for lic_a in outer_licenses:
+            left_row = []
+            right_row = []
+            for lic_b in inner_licenses:
+                comp_left = self.check_compat(lic_a, lic_b)['compatibility']
+                comp_right = self.check_compat(lic_b, lic_a)['compatibility']
+
+                if CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value in (comp_left, comp_right):
+                    self._raise_unknown_compatibility(lic_a, lic_b)
+
+                left_row.append(comp_left)
+                right_row.append(comp_right)
+            lefts.append(left_row)
+            rights.append(right_row)
+        return lefts, rights
+
+    def _raise_unknown_compatibility(self, lic_a, lic_b):
+        supported = self.supported_licenses()
+        lic_bad = ",".join({lic for lic in (lic_a, lic_b) if lic not in supported})
+        if lic_bad != "":
+            raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                             f'License expression "{lic_bad}" is not supported.')
+        else:
+            raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                             f'Licenses "{lic_a}" and "{lic_b}" do not have known compatibility both ways.')
+
     def _compatibility_status_json(self, status):
         if status == "Yes":
             return "true"
@@ -150,6 +236,12 @@ class Compatibility:
     def extend_license_db(self, file_name):
         return None
 
+    def compile_license_db(self, file_name):
+        return None
+
+    def validate_license_db(self):
+        return None
+
 
 class OsadlCompatibility(Compatibility):
     """Class to determine compatibility between licenses using OSADL's matrix
@@ -157,47 +249,28 @@ class OsadlCompatibility(Compatibility):
     This class implements Compatibility
     """
 
-    def __init__(self, license_db=None):
-        self.license_db = license_db
+    def __init__(self, license_db=None, license_db_overlays=None, default_no=False):
+        super(OsadlCompatibility, self).__init__(license_db, license_db_overlays, default_no)
+        self.matrix = load_matrix(license_db, license_db_overlays, default_no)
 
-    def check_compat(self, outbound, inbound):
-
-        raw_result = osadl_matrix.get_compatibility(outbound, inbound, self.license_db)
-
-        logging.info(f"check_compat({outbound}, {inbound} => {raw_result}")
-
-        supported = osadl_matrix.supported_licenses()
-        # if the outbound license is not supported, we cannot continue.
-        if outbound not in supported:
-            result = CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value
-            logging.debug(f'Compatibility between \"{outbound}\" and \"{inbound}\" could not be determined, since \"{outbound}\" is an unknown licenses')
+    def _check_compat(self, outbound, inbound):
+        outbound_id = self.matrix.license_id(outbound)
+        inbound_id = self.matrix.license_id(inbound)
 
         # if inbound is not supported, we continue since there might
         # be a dual license where we may end up in a situation where
         # one license is compatible and one is unknown. Instead of
         # raising an error we can notify the user in the resulting
         # data (inbound is an unknown license)
-        if inbound not in supported:
+        if inbound_id is None:
             result = CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value
             logging.debug(f'Compatibility between \"{outbound}\" and \"{inbound}\" could not be determined, since \"{inbound}\" is an unknown licenses')
+        elif outbound_id is None:
+            # if the outbound license is not supported, we cannot continue.
+            result = CompatibilityStatus.LICENSE_COMPATIBILITY_UNDEFINED.value
+            logging.debug(f'Compatibility between \"{outbound}\" and \"{inbound}\" could not be determined, since \"{outbound}\" is an unknown licenses')
         else:
-            raw_result = osadl_matrix.get_compatibility(outbound, inbound, self.license_db)
-
-            logging.info(f"check_compat({outbound}, {inbound} => {raw_result}")
-
-            if raw_result == osadl_matrix.OSADLCompatibility.YES:
-                result = CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value
-            elif raw_result == osadl_matrix.OSADLCompatibility.NO:
-                result = CompatibilityStatus.LICENSE_COMPATIBILITY_INCOMPATIBLE.value
-            elif raw_result == osadl_matrix.OSADLCompatibility.UNKNOWN:
-                result = CompatibilityStatus.LICENSE_COMPATIBILITY_UNKNOWN.value
-                logging.debug(f"compatibility: {outbound}  --> {inbound}: {result}")
-            elif raw_result == osadl_matrix.OSADLCompatibility.CHECKDEP:
-                result = CompatibilityStatus.LICENSE_COMPATIBILITY_MANUALLY_CHECK.value
-                logging.debug(f"compatibility: {outbound}  --> {inbound}: {result}")
-            elif raw_result == osadl_matrix.OSADLCompatibility.UNDEF:
-                result = CompatibilityStatus.LICENSE_COMPATIBILITY_UNDEFINED.value
-                logging.debug(f"Compatibility between \"{outbound}\" and \"{inbound}\" could not be determined. The result was: {raw_result}")
+            result = MATRIX_CODE_STATUS[self.matrix.code_by_id(outbound_id, inbound_id)]
 
         return {
             "inbound": inbound,
@@ -207,7 +280,66 @@ class OsadlCompatibility(Compatibility):
 
     def supported_licenses(self):
         """Returns a list of supported licenses"""
-        return list(osadl_matrix.supported_licenses(self.license_db))
+        return list(self.matrix.licenses)
+
+    def _compatibility_statuses(self, outer_licenses, inner_licenses):
+        """Returns the compatibility statuses, see
+        Compatibility._compatibility_statuses, using one slice of the
+        matrix (both ways) rather than one lookup per pair."""
+        unsupported = [lic for lic in set(outer_licenses) | set(inner_licenses) if not self.matrix.supported(lic)]
+        if unsupported:
+            raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                             f'License expression "{",".join(sorted(unsupported))}" is not supported.')
+
+        outer_ids = [self.matrix.license_id(lic) for lic in outer_licenses]
+        inner_ids = [self.matrix.license_id(lic) for lic in inner_licenses]
+
+        table = self.matrix.table()
+        if table is not None:
+            left_codes = table[numpy.ix_(outer_ids, inner_ids)]
+            right_codes = table[numpy.ix_(inner_ids, outer_ids)].T
+            unknowns = numpy.argwhere((left_codes == MATRIX_UNKNOWN) | (right_codes == MATRIX_UNKNOWN))
+            if len(unknowns):
+                self._raise_unknown_compatibility(outer_licenses[unknowns[0][0]], inner_licenses[unknowns[0][1]])
+            left_codes = left_codes.tolist()
+            right_codes = right_codes.tolist()
+        else:
+            left_codes = []
+            right_codes = []
+            for lic_a, outer_id in zip(outer_licenses, outer_ids):
+                row = self.matrix.row(outer_id)
+                left_row = [row[inner_id] for inner_id in inner_ids]
+                right_row = [self.matrix.code_by_id(inner_id, outer_id) for inner_id in inner_ids]
+                for lic_b, left, right in zip(inner_licenses, left_row, right_row):
+                    if MATRIX_UNKNOWN in (left, right):
+                        self._raise_unknown_compatibility(lic_a, lic_b)
+                left_codes.append(left_row)
+                right_codes.append(right_row)
+
+        lefts = [[MATRIX_CODE_STATUS[code] for code in row] for row in left_codes]
+        rights = [[MATRIX_CODE_STATUS[code] for code in row] for row in right_codes]
+        return lefts, rights
+
+    def compatible_inbounds(self, outbound):
+        outbound_id = self.matrix.license_id(outbound)
+        if outbound_id is None:
+            return 0
+        return self.matrix.inbound_bits(outbound_id)
+
+    def compatible_outbounds(self, inbounds):
+        bits = (1 << self.matrix.size) - 1
+        for inbound in inbounds:
+            inbound_id = self.matrix.license_id(inbound)
+            if inbound_id is None:
+                return 0
+            bits &= self.matrix.outbound_bits(inbound_id)
+        return bits
+
+    def license_bits(self, licenses):
+        return self.matrix.license_bits(licenses)
+
+    def bits_licenses(self, bits):
+        return self.matrix.bits_licenses(bits)
 
     def _create_matrix(self, raw):
         """
@@ -262,17 +394,13 @@ class OsadlCompatibility(Compatibility):
         return "\n".join(rows)
 
     def __add_no_to_missing_variables(self, osadl_data):
-        all_keys = osadl_data.keys()
-        fixed_matrix = osadl_data.copy()
-        for outer_key in all_keys:
-            fixed_matrix[outer_key] = osadl_data[outer_key].copy()
-            for inner_key in osadl_data[outer_key].keys():
-                for every_key in all_keys:
-                    if inner_key not in fixed_matrix:
-                        raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
-                                         f'Can\'t add "{every_key}" to "{inner_key}" since "{inner_key}" does not exist in matrix')
-                    if every_key not in fixed_matrix[inner_key]:
-                        fixed_matrix[inner_key][every_key] = "No"
+        report = validate_matrix_data(osadl_data)
+        if report['not_in_matrix']:
+            raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
+                             f'Can\'t add "No" for licenses that do not exist in matrix, see "{report["not_in_matrix"]}"')
+        fixed_matrix = {key: dict(value) for key, value in osadl_data.items()}
+        for outbound, inbounds in report['missing'].items():
+            fixed_matrix[outbound].update(dict.fromkeys(inbounds, "No"))
         return fixed_matrix
 
     def _create_matrix_json_data(self, file_name, default_no=False):
@@ -301,11 +429,10 @@ class OsadlCompatibility(Compatibility):
             osadl_data = self.__add_no_to_missing_variables(osadl_data)
 
         # Check matrix completeness
-        violations = [k for k, v in osadl_data.items() if not all(b in v for b in osadl_data.keys())]
-        valid = not any(violations)
-        if not valid:
+        report = validate_matrix_data(osadl_data)
+        if not report['valid']:
             raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
-                             f'Set of keys differs from set of values, see "{violations}". Make sure your additional matrix is complete')
+                             f'Set of keys differs from set of values, {report["missing_cells"]} missing compatibilities: "{report["missing"]}", licenses not in matrix: "{report["not_in_matrix"]}". Make sure your additional matrix is complete')
 
         osadl_data['timeformat'] = timeformat
         osadl_data['timestamp'] = timestamp
@@ -326,6 +453,24 @@ class OsadlCompatibility(Compatibility):
 
         return self._create_matrix_json_data(file_name, default_no)
 
+    def validate_license_db(self):
+        """Validates the completeness of the license db, with overlays
+        added, and returns a report (see validate_matrix_data)"""
+        license_db = self.license_db or osadl_matrix.OSADL_MATRIX_JSON
+        if is_compiled_matrix(license_db):
+            raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
+                             f'Can\'t validate compiled matrix "{license_db}", validate the matrix it was compiled from')
+        data = read_matrix_data(license_db)
+        for overlay_file in self.license_db_overlays:
+            for key, value in read_overlay(overlay_file).items():
+                data.setdefault(key, {}).update(value)
+        return validate_matrix_data(data)
+
+    def compile_license_db(self, file_name):
+        """Compiles the current license db to a binary file, file_name,
+        which can be memory mapped when used as license db."""
+        self.matrix.write_compiled(file_name)
+
 
 class LicenseChooser:
     """Interface for classes to choose from inbound licenses (where a
@@ -338,6 +483,13 @@ class LicenseChooser:
                licenses - the licenses to create a choose object for
         """
         self.licenses = licenses
+        self.ranks = self._license_ranks(licenses)
+
+    def _license_ranks(self, licenses):
+        ranks = {}
+        for rank, lic in enumerate(licenses):
+            ranks.setdefault(lic, rank)
+        return ranks
 
     def choose(self, licenses):
         """Choose the most preferred license
@@ -351,12 +503,12 @@ class LicenseChooser:
         for lic in licenses:
             # If the license is not found in the license preference list,
             # raise an error
-            if lic not in self.licenses:
+            lic_index = self.ranks.get(lic)
+            if lic_index is None:
                 raise FlictError(ReturnCodes.RET_INVALID_LICENSE_PREFERENCE,
                                  f'The supplied license preference list is incomplete. The license \"{lic}\" is missing from {self.licenses}.')
 
-            # identify the index and remember the lowest index (most preferred)
-            lic_index = self.licenses.index(lic)
+            # remember the lowest index (most preferred)
             if index is None or lic_index < index:
                 index = lic_index
 
@@ -376,6 +528,10 @@ class CustomLicenseChooser(LicenseChooser):
     pass
 
 
+# license preferences, keyed by matrix digest and licenses
+_license_preferences = {}
+
+
 class CompatibilityLicenseChooser(LicenseChooser):
     """This class provides a simple way to choose from inbound licenses
     (where a choice is offered via OR).
@@ -384,36 +540,30 @@ class CompatibilityLicenseChooser(LicenseChooser):
     with. The more licenses a license is compatible with the more
     preferred it will be. If two licenses have the same number of
     compaitbilities alpabetical order will be used to choose license.
+
+    The counts are the column sums of the matrix. The resulting
+    preference list is cached, in memory and on disk, using the
+    digest of the matrix and the licenses as key.
     """
 
-    def __init__(self, licenses):
+    def __init__(self, licenses, matrix=None):
         """Parameters:
                licenses - the licenses to create a chooser object for
+               matrix - the matrix to count compatibilities in, defaults to OSADL's matrix
         """
-        self.licenses = self._license_preferences(licenses)
-
-    def _count_compat(self, inbound, supported_licenses):
-        compat_cnt = 0
-        for outbound in supported_licenses:
-            if osadl_matrix.is_compatible(outbound, inbound):
-                compat_cnt += 1
-        return {
-            "inbound": inbound,
-            "compatible_count": compat_cnt,
-        }
-
-    def _count_compats(self, supported_licenses):
-        compats = []
-        for inbound in supported_licenses:
-            compats.append(self._count_compat(inbound, supported_licenses))
-        compats_sorted = sorted(compats, key=lambda element: (element['compatible_count'], element['inbound']))
-        compats_sorted.reverse()
-        return compats_sorted
+        self.matrix = matrix or load_matrix()
+        super(CompatibilityLicenseChooser, self).__init__(self._license_preferences(licenses))
 
     def _license_preferences(self, supported_licenses):
-        compats_sorted = self._count_compats(supported_licenses)
-        pref_list = []
-        for lic in compats_sorted:
-            pref_list.append(lic['inbound'])
-
-        return pref_list
+        key = cache_key(self.matrix.digest(), *supported_licenses)
+        if key in _license_preferences:
+            return list(_license_preferences[key])
+
+        cache_name = f'license-preferences-{key}'
+        pref_list = read_cache(cache_name)
+        if pref_list is None:
+            pref_list = license_ranking(self.matrix, supported_licenses)
+            write_cache(cache_name, pref_list)
+
+        _license_preferences[key] = pref_list
+        return list(pref_list)
@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import hashlib
+import json
+import logging
+import os
+
+from flict.flictlib import flict_config
+
+
+def cache_key(*parts):
+    """Returns a key (hex digest) for the supplied (str) parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _cache_file(name, cache_dir):
+    return os.path.join(cache_dir, f'{name}.json')
+
+
+def read_cache(name, cache_dir=None):
+    """Returns the data stored in the cache as name, None if not found
+    or if the cache can't be read"""
+    cache_dir = flict_config.DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return None
+    try:
+        with open(_cache_file(name, cache_dir)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(name, data, cache_dir=None):
+    """Stores data (JSON) in the cache as name. The data is written to
+    a temporary file which is then renamed, so concurrent readers and
+    writers never see a partially written file. Failing to write is
+    not an error, the cache is only an optimization."""
+    cache_dir = flict_config.DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    if not cache_dir:
+        return
+    cache_file = _cache_file(name, cache_dir)
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_file, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.debug(f'Could not write cache file "{cache_file}": {e}')
+        try:
+            os.remove(tmp_file)
+        except OSError:  # noqa: S110 - the temporary file may not have been created
+            pass
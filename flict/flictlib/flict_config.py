@@ -37,3 +37,6 @@ VAR_DIR = os.path.join(SCRIPT_DIR, "var")
 
 DEFAULT_MATRIX_FILE = _userconfig.get('matrix-file', OSADL_MATRIX_JSON)
 DEFAULT_OUTPUT_FORMAT = _userconfig.get('output-format', "JSON")
+DEFAULT_CACHE_DIR = _userconfig.get('cache-dir', os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.environ.get('HOME', '/does/not/exist'), '.cache')), 'flict'))
+DEFAULT_COMPATIBILITY_CACHE_SIZE = _userconfig.get('compatibility-cache-size', 4096)
+DEFAULT_LICENSE_CACHE_SIZE = _userconfig.get('license-cache-size', 1024)
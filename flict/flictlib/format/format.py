@@ -8,6 +8,8 @@
 #
 ###################################################################
 
+from flict.flictlib.utils import outbound_compatibility
+
 
 class FlictFormatter:
 
@@ -29,12 +31,21 @@ class FlictFormatter:
     def format_simplified(self, simplified):
         return "default implementation | format_simplified(): " + str(simplified)
 
+    def format_normalized(self, normalized):
+        return "default implementation | format_normalized(): " + str(normalized)
+
     def format_verified_license(self, license_expression, outbound_candidate):
         return "default implementation | format_verified_license(): " + str(license_expression)
 
     def format_compatibilities(self, compats):
         return
 
+    def format_matrix_diff(self, diff):
+        return "default implementation | format_matrix_diff(): " + str(diff)
+
+    def format_matrix_validation(self, report):
+        return "default implementation | format_matrix_validation(): " + str(report)
+
     def format_licenses(self, licenses):
         return
 
@@ -42,13 +53,10 @@ class FlictFormatter:
         return
 
     def get_dep_license(self, dep, outbound):
-        for lic_compat in dep.get('compatibility'):
-            outbound_lic = lic_compat['outbound']['name']
-
-            if outbound_lic == outbound:
-                name = self.license.verified_to_license(lic_compat)
-                return name
-        return None
+        lic_compat = outbound_compatibility(dep, outbound)
+        if lic_compat is None:
+            return None
+        return self.license.verified_to_license(lic_compat)
 
     def find_compat(self, compats, license_name):
         for compat in compats['compatibilities']:
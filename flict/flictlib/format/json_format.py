@@ -35,6 +35,9 @@ class JsonFormatter(FlictFormatter):
     def format_simplified(self, simplified):
         return json.dumps(simplified)
 
+    def format_normalized(self, normalized):
+        return json.dumps(normalized)
+
     def format_verified_license(self, license_expression, outbound_candidate):
         compat = len(outbound_candidate) != 0
         return json.dumps({"license_expression": license_expression,
@@ -51,5 +54,11 @@ class JsonFormatter(FlictFormatter):
     def format_licenses(self, licenses):
         return json.dumps(licenses)
 
+    def format_matrix_diff(self, diff):
+        return json.dumps(diff)
+
+    def format_matrix_validation(self, report):
+        return json.dumps(report)
+
     def format_verification(self, verification):
         return json.dumps(verification)
@@ -74,6 +74,11 @@ class MarkdownFlictFormatter(FlictFormatter):
         # Simplified license\n\n{simplified['simplified']}
         """
 
+    def format_normalized(self, normalized):
+        ret = ["| Original license | Normalized license |", "| --- | --- |"]
+        ret += [f"| {item['original']} | {item['normalized']} |" for item in normalized]
+        return "\n".join(ret)
+
     def packages_header(self):
         return f"{self.headers['packages']} Packages\n"
 
@@ -32,6 +32,9 @@ class TextFormatter(FlictFormatter):
     def format_simplified(self, simplified):
         return simplified['simplified']
 
+    def format_normalized(self, normalized):
+        return "\n".join([item['normalized'] for item in normalized])
+
     def format_verified_license(self, license_expression, outbound_candidate):
         ret_str = f'The licenses in the expression "{license_expression.strip()}" are'
         if len(outbound_candidate) == 0:
@@ -116,6 +119,37 @@ class TextFormatter(FlictFormatter):
 
         return "\n".join(ret)
 
+    def format_matrix_diff(self, diff):
+        ret = [f'Licenses added: {", ".join(diff["licenses_added"])}',
+               f'Licenses removed: {", ".join(diff["licenses_removed"])}',
+               f'Changed compatibilities: {len(diff["changed"])}']
+        for cell in diff['changed']:
+            ret.append(f' {cell["outbound"]} <- {cell["inbound"]}: {cell["old"]} -> {cell["new"]}')
+        ranking = diff.get('ranking')
+        moved = []
+        if ranking:
+            old_ranks = {lic: rank for rank, lic in enumerate(ranking['old'])}
+            moved = [(old_ranks[lic], rank, lic) for rank, lic in enumerate(ranking['new']) if old_ranks[lic] != rank]
+        ret.append(f'Changed outbound preferences: {len(moved)}')
+        for old_rank, new_rank, lic in moved:
+            ret.append(f' {lic}: {old_rank + 1} -> {new_rank + 1}')
+        ret.append(f'Affected packages: {len(diff["impacted"])}')
+        for package in diff['impacted']:
+            ret.append(f' {package["package"]} {package["version"]} ({package["report"]})')
+            for reason in package['reasons']:
+                ret.append(f'     {reason}')
+        return "\n".join(ret)
+
+    def format_matrix_validation(self, report):
+        ret = [f'Valid: {"Yes" if report["valid"] else "No"}',
+               f'Licenses: {report["licenses"]}',
+               f'Missing compatibilities: {report["missing_cells"]}']
+        for outbound, inbounds in report['missing'].items():
+            ret.append(f' {outbound}: missing {", ".join(inbounds)}')
+        for outbound, inbounds in report['not_in_matrix'].items():
+            ret.append(f' {outbound}: not in matrix {", ".join(inbounds)}')
+        return "\n".join(ret)
+
     def format_compatibilities(self, compats):
         compatible = len(compats['result']['allowed_outbound_licenses']) > 0
         return "Yes" if compatible else "No"
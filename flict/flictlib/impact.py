@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+
+from flict.flictlib.return_codes import FlictError, ReturnCodes
+
+
+class ImpactIndex:
+    """Index of the licenses used by the packages in verification
+    reports (as created by verify), used to find the packages whose
+    verification may change when the license matrix changes.
+
+    For every license two indices are kept:
+        outbound - packages where the license is checked as outbound
+        inbound - packages where the license is used, by the package or a dependency
+
+    The packages with more than one allowed outbound license are kept
+    as well, since the outbound license chosen for them depends on how
+    the matrix ranks the licenses.
+    """
+
+    def __init__(self):
+        self.outbound = {}
+        self.inbound = {}
+        self.allowed_outbounds = {}
+        self.packages = {}
+
+    def add_report_file(self, file_name):
+        try:
+            with open(file_name) as fp:
+                report = json.load(fp)
+        except json.JSONDecodeError:
+            raise FlictError(ReturnCodes.RET_INVALID_PROJECT, f'File "{file_name}" does not contain valid JSON data')
+        except (FileNotFoundError, IsADirectoryError):
+            raise FlictError(ReturnCodes.RET_FILE_NOT_FOUND, f'File "{file_name}" could not be found or is a directory')
+        self.add_report(file_name, report)
+
+    def add_report(self, report_name, report):
+        """Adds the packages in the verification report to the index"""
+        try:
+            for package in report['packages']:
+                key = (report_name, package['name'], package.get('version', ''))
+                self.packages[key] = {
+                    'report': report_name,
+                    'project_name': report.get('project_name', ''),
+                    'package': package['name'],
+                    'version': package.get('version', ''),
+                }
+
+                for lic in package.get('licenses_to_check', []):
+                    self.outbound.setdefault(lic, set()).add(key)
+
+                allowed_outbounds = package.get('allowed_outbound_licenses', [])
+                if len(allowed_outbounds) > 1:
+                    self.allowed_outbounds[key] = allowed_outbounds
+
+                for package_info in [package] + package.get('dependencies', []):
+                    for lic in self._inbound_licenses(package_info):
+                        self.inbound.setdefault(lic, set()).add(key)
+        except (KeyError, TypeError):
+            raise FlictError(ReturnCodes.RET_INVALID_PROJECT, f'"{report_name}" is not a verification report')
+
+    def _inbound_licenses(self, package_info):
+        # the compatibility trees only differ in the outbound license
+        # and the results, so the first one holds all the licenses
+        compats = package_info.get('compatibility', [])
+        licenses = set()
+        if compats:
+            self._tree_licenses(compats[0], licenses)
+        return licenses
+
+    def _tree_licenses(self, expr, licenses):
+        if expr['type'] == 'license':
+            licenses.add(expr['name'])
+        else:
+            for operand in expr['operands']:
+                self._tree_licenses(operand, licenses)
+
+    def impacted(self, diff):
+        """Returns the packages whose verification may change due to the
+        differences (see diff_matrices), with the reasons, as a list"""
+        reasons = {}
+        for cell in diff['changed']:
+            keys = self.outbound.get(cell['outbound'], set()) & self.inbound.get(cell['inbound'], set())
+            for key in keys:
+                reasons.setdefault(key, []).append(f'{cell["outbound"]} <- {cell["inbound"]}: {cell["old"]} -> {cell["new"]}')
+
+        for lic in diff['licenses_added'] + diff['licenses_removed']:
+            keys = self.outbound.get(lic, set()) | self.inbound.get(lic, set())
+            for key in keys:
+                reasons.setdefault(key, []).append(f'{lic}: added or removed')
+
+        ranking = diff.get('ranking')
+        if ranking:
+            old_ranks = {lic: rank for rank, lic in enumerate(ranking['old'])}
+            new_ranks = {lic: rank for rank, lic in enumerate(ranking['new'])}
+            for key, allowed_outbounds in self.allowed_outbounds.items():
+                ranked = [lic for lic in allowed_outbounds if lic in old_ranks]
+                old_order = sorted(ranked, key=old_ranks.get)
+                new_order = sorted(ranked, key=new_ranks.get)
+                if old_order != new_order:
+                    reasons.setdefault(key, []).append(f'outbound preference: {", ".join(old_order)} -> {", ".join(new_order)}')
+
+        return [dict(self.packages[key], reasons=reasons[key]) for key in sorted(reasons)]
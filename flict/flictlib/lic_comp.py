@@ -11,20 +11,123 @@ from flict.flictlib.compatibility import LICENSE_COMPATIBILITY_OR
 from flict.flictlib.compatibility import CompatibilityLicenseChooser
 from flict.flictlib.compatibility import CustomLicenseChooser
 from flict.flictlib.license import License
+from flict.flictlib.license_parser import LicenseNode
+from flict.flictlib.license_parser import OperatorNode
 from flict.flictlib.return_codes import FlictError, ReturnCodes
 
 COMPATIBILITY_TAG = "compatibility"
 
 
+class LicenseCheck:
+    """The compatibility between an outbound license and an inbound license"""
+
+    __slots__ = ('name', 'outbound', 'compatibility', 'allowed', 'problems')
+
+    def __init__(self, name, outbound, compatibility, allowed, problems):
+        """Parameters:
+               name - the inbound license (str)
+               outbound - the parsed outbound license (dict)
+               compatibility - compatibility status (str)
+               allowed - if the inbound license is allowed (bool)
+               problems - problems found (tuple)
+        """
+        self.name = name
+        self.outbound = outbound
+        self.compatibility = compatibility
+        self.allowed = allowed
+        self.problems = problems
+
+    def to_dict(self, dicts=None):
+        """Returns the check as a dict, as used in reports and by the formatters"""
+        return {
+            'type': 'license',
+            'name': self.name,
+            'check': 'inbounds_outbound',
+            'outbound': self.outbound,
+            'problems': list(self.problems),
+            'allowed': self.allowed,
+            COMPATIBILITY_TAG: self.compatibility,
+        }
+
+
+class OperatorCheck:
+    """The compatibility between an outbound license and the inbound
+    licenses (checks) combined with an operator"""
+
+    __slots__ = ('name', 'operands', 'outbound', 'compatibility', 'allowed', 'problems')
+
+    def __init__(self, name, operands, outbound, compatibility, allowed, problems):
+        self.name = name
+        self.operands = operands
+        self.outbound = outbound
+        self.compatibility = compatibility
+        self.allowed = allowed
+        self.problems = problems
+
+    def to_dict(self, dicts=None):
+        """Returns the check as a dict, as used in reports and by the
+        formatters. Checks shared between operators are transformed once."""
+        if dicts is None:
+            dicts = {}
+        operands = []
+        for operand in self.operands:
+            operand_dict = dicts.get(id(operand))
+            if operand_dict is None:
+                operand_dict = operand.to_dict(dicts)
+                dicts[id(operand)] = operand_dict
+            operands.append(operand_dict)
+
+        return {
+            'type': 'operator',
+            'name': self.name,
+            'operands': operands,
+            # store outbound to make for easier reading of result
+            'outbound': self.outbound,
+            COMPATIBILITY_TAG: self.compatibility,
+            'allowed': self.allowed,
+            'check': 'inbounds_outbound',
+            'problems': list(self.problems),
+        }
+
+
+class NotEvaluatedCheck:
+    """An operand left unevaluated since the operator's result was
+    already decided (short-circuit evaluation)"""
+
+    __slots__ = ('node', 'outbound')
+
+    def __init__(self, node, outbound):
+        self.node = node
+        self.outbound = outbound
+
+    def to_dict(self, dicts=None):
+        expr = {
+            'type': self.node.type,
+            'name': self.node.name,
+        }
+        if self.node.type == OperatorNode.type:
+            expr['operands'] = [NotEvaluatedCheck(operand, self.outbound).to_dict() for operand in self.node.operands]
+        expr.update({
+            'check': 'not_evaluated',
+            'outbound': self.outbound,
+            'problems': [],
+            COMPATIBILITY_TAG: CompatibilityStatus.LICENSE_COMPATIBILITY_NOT_EVALUATED.value,
+        })
+        return expr
+
+
 class LicenseCompatibilty:
 
-    def __init__(self, license_db=None, licenses_preferences=None, denied_licenses=None, allowed_licenses=None, update_dual=True):
+    def __init__(self, license_db=None, licenses_preferences=None, denied_licenses=None, allowed_licenses=None, update_dual=True,
+                 license_db_overlays=None, overlay_default_no=False, short_circuit=False):
         self.license = License(denied_licenses, allowed_licenses, update_dual)
+        # stop evaluating an operator's operands once the result is decided
+        self.short_circuit = short_circuit
 
-        self.compatibility = CompatibilityFactory.get_compatibility(license_db)
+        self.compatibility = CompatibilityFactory.get_compatibility(license_db, license_db_overlays, overlay_default_no)
 
         if not licenses_preferences or licenses_preferences == []:
-            self.license_chooser = CompatibilityLicenseChooser(self.compatibility.supported_licenses())
+            self.license_chooser = CompatibilityLicenseChooser(self.compatibility.supported_licenses(), self.compatibility.matrix)
         else:
             self.license_chooser = CustomLicenseChooser(licenses_preferences)
 
@@ -84,94 +187,114 @@ class LicenseCompatibilty:
             }
 
         """
-        parsed_outbound = self.license.get_license([outbound])
-
         logging.debug(f"inbounds_outbound_check({outbound}, {expr})")
-        parsed = self.license.get_license(expr)
-        logging.debug(f"inbounds_outbound_check: parsed:{parsed}")
+        return self.evaluate_expression(outbound, self.compile_expression(expr)).to_dict()
 
-        return self._inbounds_outbound_check(parsed_outbound, parsed)
+    def compile_expression(self, expr):
+        """
+        Returns the inbound license expression (list) compiled to an
+        immutable CompiledExpression, parsed only once no matter how many
+        outbound licenses it is evaluated against.
+        """
+        return self.license.compile_license(expr)
+
+    def evaluate_expression(self, outbound, compiled):
+        """
+        Checks how the outbound license is compatible to the compiled
+        inbound license expression. The compiled expression is not
+        modified, the result is returned as a new tree of LicenseCheck and
+        OperatorCheck objects (use to_dict for the same form as from
+        inbounds_outbound_compatibility). Identical subexpressions are
+        checked once, and share the result.
+
+        With short_circuit set, the remaining operands of an operator are
+        not evaluated once its compatibility is decided, they are included
+        as NotEvaluatedCheck objects.
+
+        Parameters:
+            outbound - outbound license (str)
+            compiled - inbound license expression (CompiledExpression)
+        """
+        parsed_outbound = self.license.get_license([outbound])
+        return self._inbounds_outbound_check(parsed_outbound, compiled.tree, {})
 
     def __internal_expr_to_str(self, expr):
-        if self.license.is_license(expr):
-            return expr['name']
-        elif self.license.is_operator(expr):
-            raise FlictError(ReturnCodes.RET_INTERNAL_ERROR,
-                             f'Internal error. Cannot transform {expr} to a license expression')
+        if isinstance(expr, LicenseCheck):
+            return expr.name
+        raise FlictError(ReturnCodes.RET_INTERNAL_ERROR,
+                         f'Internal error. Cannot transform {expr} to a license expression')
+
+    def _inbounds_outbound_check_operand(self, outbound, node, results):
+        # get compatibility_tag between the operand and the outbound
+        operand = self._inbounds_outbound_check(outbound, node, results)
+        compat_tag = operand.compatibility
+        if compat_tag == "Unknown":
+            operand.problems += (f'Unknown license compatibility between outbound \'{outbound["name"]}\' and inbound \'{self.__internal_expr_to_str(operand)}\'',)
+        elif compat_tag.startswith("Check"):
+            operand.problems += (f'Manually check license compatibility between {outbound}',)
+        elif compat_tag == "Undefined":
+            operand.problems += (f'Undefined license compatibility between outbound \'{outbound["name"]}\' and inbound \'{self.__internal_expr_to_str(operand)}\'',)
+        return operand
 
-    def _inbounds_outbound_check_operator(self, outbound, expr):
+    def _inbounds_outbound_check_operator(self, outbound, node, results):
         compat_summary = None
         allowed_summary = None
         problem_summary = []
-        op = self.license.operator(expr)
-        operands = self.license.operands(expr)
-        for operand in operands:
-            problems = []
-            logging.debug(f"Check operand: {operand}")
-
-            # get compatibility_tag between the operand and the outbound
-            # and calculate and store the summarized compatibility
-            compat = self._inbounds_outbound_check(outbound, operand)
-            problem_summary += compat['problems']
-            compat_tag = compat[COMPATIBILITY_TAG]
-            if compat_tag == "Yes" or compat_tag == "No":
-                compat_summary = self._update_compat(op, compat_summary, compat_tag == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value)
-            elif compat_tag == "Unknown":
-                problems.append(f'Unknown license compatibility between outbound \'{outbound["name"]}\' and inbound \'{self.__internal_expr_to_str(operand)}\'')
-                compat_summary = self._update_compat(op, compat_summary, compat_tag == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value)
-            elif compat_tag.startswith("Check"):
-                problems.append(f'Manually check license compatibility between {outbound}')
-                compat_summary = self._update_compat(op, compat_summary, compat_tag == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value)
-            elif compat_tag == "Undefined":
-                problems.append(f'Undefined license compatibility between outbound \'{outbound["name"]}\' and inbound \'{self.__internal_expr_to_str(operand)}\'')
-                compat_summary = self._update_compat(op, compat_summary, compat_tag == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value)
+        operands = []
+        for operand_node in node.operands:
+            logging.debug(f"Check operand: {operand_node}")
+
+            # identical subexpressions are the same node, so check
+            # each node only once and share the result
+            operand = results.get(id(operand_node))
+            if operand is None:
+                operand = self._inbounds_outbound_check_operand(outbound, operand_node, results)
+                results[id(operand_node)] = operand
+
+            # calculate and store the summarized compatibility
+            problem_summary += operand.problems
+            compat_summary = self._update_compat(node.name, compat_summary, operand.compatibility == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value)
 
             # are licenses allowed or denied for this expression
-            allowed = compat['allowed']
-            allowed_summary = self._update_allowed(op, allowed_summary, allowed)
-            operand['allowed'] = allowed
-            operand[COMPATIBILITY_TAG] = compat[COMPATIBILITY_TAG]
-            operand["problems"] += problems
-            if problems:
-                problem_summary += problems
-
-        # store outbound to make for easier reading of result
-        expr['outbound'] = outbound
-        expr[COMPATIBILITY_TAG] = compat_summary
-        expr["allowed"] = allowed_summary
-        expr['check'] = 'inbounds_outbound'
-        expr['problems'] = expr.get('problems', []) + problem_summary
-        return expr
+            allowed_summary = self._update_allowed(node.name, allowed_summary, operand.allowed)
+            operands.append(operand)
+
+            if self.short_circuit and self._compat_decided(node.name, compat_summary):
+                operands += [NotEvaluatedCheck(operand_node, outbound) for operand_node in node.operands[len(operands):]]
+                break
 
-    def _inbounds_outbound_check_license(self, _outbound, expr):
-        inbound = self.license.license_name(expr)
+        return OperatorCheck(node.name, tuple(operands), outbound, compat_summary, allowed_summary, tuple(problem_summary))
+
+    def _inbounds_outbound_check_license(self, _outbound, node):
+        inbound = node.name
         outbound = self.license.license_name(_outbound)
-        problems = []
         compat = self.compatibility.check_compat(outbound, inbound)
         compat_tag = compat[COMPATIBILITY_TAG]
+        problems = self._compat_problems(outbound, inbound, compat_tag)
+
+        return LicenseCheck(inbound, _outbound, compat_tag, self.license.license_allowed(inbound), problems)
+
+    def _compat_problems(self, outbound, inbound, compat_tag):
         if compat_tag == "Unknown":
-            problems.append(f'Unknown license compatibility between outbound \'{outbound}\' and inbound \'{inbound}\'')
+            return (f'Unknown license compatibility between outbound \'{outbound}\' and inbound \'{inbound}\'',)
         elif compat_tag.startswith("Check"):
-            problems.append(f'Manually check license compatibility between {outbound}')
+            return (f'Manually check license compatibility between {outbound}',)
         elif compat_tag == "Undefined":
-            problems.append(f'Undefined license compatibility between outbound \'{outbound}\' and inbound \'{inbound}\'')
-
-        expr['check'] = 'inbounds_outbound'
-        expr['outbound'] = _outbound
-        expr['problems'] = expr.get('problems', []) + problems
-        expr['allowed'] = self.license.license_allowed(inbound)
-        expr[COMPATIBILITY_TAG] = compat[COMPATIBILITY_TAG]
-        return expr
-
-    def _inbounds_outbound_check(self, outbound, expr):
-        logging.debug(f"_inbounds_outbound_check({outbound}, {expr})")
-        if self.license.is_license(expr):
-            return self._inbounds_outbound_check_license(outbound, expr)
-        elif self.license.is_operator(expr):
-            return self._inbounds_outbound_check_operator(outbound, expr)
-        else:
-            raise FlictError(ReturnCodes.RET_INTERNAL_ERROR,
-                             f"Could not parse one of the expression: {outbound}, {expr}")
+            return (f'Undefined license compatibility between outbound \'{outbound}\' and inbound \'{inbound}\'',)
+        return ()
+
+    def _inbounds_outbound_check(self, outbound, node, results):
+        logging.debug(f"_inbounds_outbound_check({outbound['name']}, {node})")
+        if node.type == LicenseNode.type:
+            return self._inbounds_outbound_check_license(outbound, node)
+        return self._inbounds_outbound_check_operator(outbound, node, results)
+
+    def _compat_decided(self, op, current):
+        """Returns True if the summarized compatibility can not change by
+        more operands, i.e. OR is compatible or AND is incompatible"""
+        if op == LICENSE_COMPATIBILITY_OR:
+            return current == CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value
+        return current == CompatibilityStatus.LICENSE_COMPATIBILITY_INCOMPATIBLE.value
 
     def _update_compat(self, op, current, new):
         if current is None:
@@ -202,12 +325,122 @@ class LicenseCompatibilty:
     def supported_licenses(self):
         return self.compatibility.supported_licenses()
 
+    def cache_statistics(self):
+        return self.compatibility.cache_statistics()
+
+    def license_cache_statistics(self):
+        return self.license.cache_statistics()
+
+    def license_bits(self, licenses):
+        return self.compatibility.license_bits(licenses)
+
+    def bits_licenses(self, bits):
+        return self.compatibility.bits_licenses(bits)
+
+    def compatible_outbounds(self, inbounds):
+        """Returns the outbound licenses (list) that are compatible with all of the inbound licenses"""
+        return self.compatibility.bits_licenses(self.compatibility.compatible_outbounds(inbounds))
+
+    def compatible_outbound_bits(self, node, results=None):
+        """Returns a bitset (int) of the outbound licenses the compiled
+        license expression node is compatible with. A license is the
+        matrix column of compatible outbounds, AND is evaluated as a
+        bitwise and (intersection) and OR as a bitwise or (union).
+        Identical subexpressions (nodes) are evaluated once."""
+        if results is None:
+            results = {}
+        bits = results.get(id(node))
+        if bits is not None:
+            return bits
+
+        if node.type == LicenseNode.type:
+            bits = self.compatibility.compatible_outbounds([node.name])
+        else:
+            operand_bits = [self.compatible_outbound_bits(operand, results) for operand in node.operands]
+            bits = operand_bits[0]
+            if node.name == LICENSE_COMPATIBILITY_AND:
+                for operand_bit in operand_bits[1:]:
+                    bits &= operand_bit
+            else:
+                for operand_bit in operand_bits[1:]:
+                    bits |= operand_bit
+        results[id(node)] = bits
+        return bits
+
+    def expression_outbound_bits(self, expr):
+        """
+        Returns a bitset (int), over all supported licenses, of the
+        outbound licenses the inbound license expression is compatible
+        with. This is the same as checking the expression with
+        inbounds_outbound_compatibility for every supported outbound
+        license and keeping the ones with compatibility "Yes", but done
+        in one evaluation of the expression.
+
+        Parameters:
+            expr - inbound license expression (list)
+        """
+        return self.compatible_outbound_bits(self.compile_expression(expr).tree)
+
+    def expression_problems(self, expr, outbounds):
+        """
+        Returns the problems (set), e.g. unknown compatibilities, found
+        when checking the inbound license expression against each of the
+        outbound licenses. These are the same problems as in the checks
+        from evaluate_expression, without creating any checks unless
+        short_circuit is set (some licenses are then never checked).
+
+        Parameters:
+            expr - inbound license expression (list)
+            outbounds - outbound licenses (list)
+        """
+        problems = set()
+        compiled = self.compile_expression(expr)
+        if self.short_circuit:
+            for outbound in outbounds:
+                problems.update(self.evaluate_expression(outbound, compiled).problems)
+            return problems
+
+        for inbound in self._node_licenses(compiled.tree, {}):
+            for outbound in outbounds:
+                compat_tag = self.compatibility.check_compat(outbound, inbound)[COMPATIBILITY_TAG]
+                problems.update(self._compat_problems(outbound, inbound, compat_tag))
+        return problems
+
+    def _node_licenses(self, node, licenses):
+        # the license names in the node, as dict keys (in order)
+        if node.type == LicenseNode.type:
+            licenses[node.name] = None
+        else:
+            for operand in node.operands:
+                self._node_licenses(operand, licenses)
+        return licenses
+
+    def expression_compatible_outbounds(self, expr, outbounds=None):
+        """
+        Returns the outbound licenses (list) the inbound license
+        expression is compatible with.
+
+        Parameters:
+            expr - inbound license expression (list)
+            outbounds - outbound licenses to consider, all supported licenses if None
+        """
+        bits = self.expression_outbound_bits(expr)
+        if outbounds is not None:
+            bits &= self.compatibility.license_bits(outbounds)
+        return self.compatibility.bits_licenses(bits)
+
     def check_compatibilities(self, licenses, check_all=False):
         return self.compatibility.check_compatibilities(licenses, check_all)
 
     def extend_license_db(self, file_name, oformat="JSON", default_no=False):
         return self.compatibility.extend_license_db(file_name, oformat, default_no)
 
+    def validate_license_db(self):
+        return self.compatibility.validate_license_db()
+
+    def compile_license_db(self, file_name):
+        return self.compatibility.compile_license_db(file_name)
+
     def simplify_license(self, expr):
         return self.license.simplify_license(expr)
 
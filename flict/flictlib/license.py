@@ -2,18 +2,131 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import copy
+
+from flict.flictlib import flict_config
+from flict.flictlib.disk_cache import cache_key, read_cache, write_cache
 from flict.flictlib.license_parser import LicenseParserFactory
+from flict.flictlib.lru_cache import LRUCache
 from flict.flictlib.return_codes import FlictError, ReturnCodes
 
+from flame.config import SW_VERSION as FLAME_VERSION # noqa: I900
 from flame.license_db import FossLicenses # noqa: I900
 
+# parse results, keyed by canonical license expression
+license_cache = LRUCache(flict_config.DEFAULT_LICENSE_CACHE_SIZE)
+
+# flame normalization results, keyed by (expression, update_dual)
+compatible_license_cache = LRUCache(flict_config.DEFAULT_LICENSE_CACHE_SIZE)
+
+def canonical_expression(expr):
+    """Returns a canonical form of the license expression, to be used as key
+    when caching parse results.
+
+    Whitespace and the case of the operators are normalised. The
+    terms of an expression without parentheses using only one of AND
+    or OR are sorted (and duplicates removed), so "X11 OR MIT" and
+    "MIT OR X11" have the same canonical form.
+
+    Parameters:
+        expr - license expression (str)
+    """
+    tokens = []
+    for token in expr.replace("(", " ( ").replace(")", " ) ").split():
+        if token.upper() in ("AND", "OR", "WITH"):
+            token = token.upper()
+        tokens.append(token)
+
+    operators = {token for token in tokens if token in ("AND", "OR")}
+    if "(" in tokens or ")" in tokens or len(operators) != 1:
+        return " ".join(tokens)
+
+    op = operators.pop()
+    terms = [[]]
+    for token in tokens:
+        if token == op:
+            terms.append([])
+        else:
+            terms[-1].append(token)
+    if [] in terms:
+        # invalid expression, leave it to the parser
+        return " ".join(tokens)
+    return f" {op} ".join(sorted({" ".join(term) for term in terms}))
+
 def compatible_license(license_expr, update_dual=True):
-    if not hasattr(compatible_license, "fl"):
-        compatible_license.fl = FossLicenses()
-    return compatible_license.fl.expression_compatibility_as(license_expr, update_dual=update_dual)
+    """Returns flame's normalization (expression_compatibility_as) of
+    the license expression.
+
+    The results are cached in memory and on disk (see disk_cache),
+    keyed by the expression, update_dual and flame's version. The
+    flame license database is only loaded if the result is not
+    cached.
+
+    Parameters:
+        license_expr - license expression (str)
+        update_dual - if True, dual licenses (e.g. GPL-2.0-or-later) are expanded
+    """
+    return copy.deepcopy(_compatible_license(license_expr, update_dual))
 
 def compatible_license_short(license_expr, update_dual=True):
-    return compatible_license(license_expr, update_dual)['compat_license']
+    return _compatible_license(license_expr, update_dual)['compat_license']
+
+def normalize_licenses(license_exprs, update_dual=True):
+    """Returns a dict with the normalized (see compatible_license_short)
+    form of each distinct license expression, keyed by the expression.
+
+    Duplicates are normalized only once, so a list with the licenses
+    of all the packages in a project can be passed as is.
+
+    Parameters:
+        license_exprs - license expressions (list of str)
+        update_dual - if True, dual licenses (e.g. GPL-2.0-or-later) are expanded
+    """
+    return {expr: compatible_license_short(expr, update_dual) for expr in dict.fromkeys(license_exprs)}
+
+def _compatible_license(license_expr, update_dual):
+    key = (license_expr, update_dual)
+    compat = compatible_license_cache.get(key)
+    if compat is not None:
+        return compat
+
+    cache_name = f'flame-{cache_key(FLAME_VERSION, str(update_dual), str(license_expr))}'
+    compat = read_cache(cache_name)
+    if compat is None:
+        if not hasattr(compatible_license, "fl"):
+            compatible_license.fl = FossLicenses()
+        compat = compatible_license.fl.expression_compatibility_as(license_expr, update_dual=update_dual)
+        write_cache(cache_name, compat)
+
+    compatible_license_cache.put(key, compat)
+    return compat
+
+
+class CompiledExpression:
+    """An immutable, parsed, license expression that can be evaluated
+    against any number of outbound licenses (see
+    LicenseCompatibilty.evaluate_expression) without being modified.
+
+    The tree consists of LicenseNode and OperatorNode objects (see
+    LicenseParser.license_nodes), identical subexpressions are the same
+    node.
+    """
+
+    __slots__ = ('expression', 'tree')
+
+    def __init__(self, expression, tree):
+        """Parameters:
+               expression - the license expression (str)
+               tree - the license expression's nodes, from LicenseParser.license_nodes
+        """
+        object.__setattr__(self, 'expression', expression)
+        object.__setattr__(self, 'tree', tree)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __repr__(self):
+        return f"CompiledExpression({self.expression!r})"
 
 
 class License():
@@ -23,7 +136,7 @@ class License():
     GPL-2.0-or-later or (GPL-3.0-only WITH GCC-exception-3.1 AND curl
     """
 
-    def __init__(self, denied_licenses, allowed_licenses, update_dual=True):
+    def __init__(self, denied_licenses=None, allowed_licenses=None, update_dual=True):
         self._denied_licenses = denied_licenses
         self._allowed_licenses = allowed_licenses
         # Either denied or allower or none: OK
@@ -34,8 +147,40 @@ class License():
         self.parser = LicenseParserFactory.get_parser()
         self.update_dual = update_dual
 
+    def _parse_license(self, expr):
+        """Returns the parse result of the license expression (str), using
+        the cache if the same (canonical) expression has been parsed before.
+        The result is shared and must not be modified."""
+        key = canonical_expression(expr)
+        parsed = license_cache.get(key)
+        if parsed is None:
+            parsed = self.parser.parse_license([expr])
+            license_cache.put(key, parsed)
+        return parsed
+
     def get_license(self, expr):
-        return self.parser.parse_license(expr)['license']
+        if not isinstance(expr, list) or len(expr) == 0 or len(expr[0]) == 0:
+            # let the parser report the invalid expression
+            return self.parser.parse_license(expr)['license']
+
+        # callers add compatibility results to the tree, so return a copy
+        return copy.deepcopy(self._parse_license(" ".join(expr))['license'])
+
+    def compile_license(self, expr):
+        """Returns the license expression (list) as a CompiledExpression.
+        Compiled expressions are cached, just as the parse results."""
+        if not isinstance(expr, list) or len(expr) == 0 or len(expr[0]) == 0:
+            # let the parser report the invalid expression
+            self.parser.parse_license(expr)
+
+        lic_expr = " ".join(expr)
+        key = ("compiled", canonical_expression(lic_expr))
+        compiled = license_cache.get(key)
+        if compiled is None:
+            nodes = self.parser.license_nodes(self._parse_license(lic_expr)['simplified'])
+            compiled = CompiledExpression(lic_expr, nodes)
+            license_cache.put(key, compiled)
+        return compiled
 
     def license_name(self, expr):
         return self.parser.license(expr)
@@ -47,7 +192,16 @@ class License():
         return self.parser.operands(expr)
 
     def licenses(self, expr):
-        return self.parser.licenses(expr)
+        key = ("licenses", canonical_expression(expr))
+        licenses = license_cache.get(key)
+        if licenses is None:
+            licenses = tuple(self.parser.licenses(expr))
+            license_cache.put(key, licenses)
+        return list(licenses)
+
+    def cache_statistics(self):
+        """Returns hits, misses and evictions of the license cache"""
+        return license_cache.statistics()
 
     def denied_licenses(self):
         return self._denied_licenses
@@ -68,7 +222,7 @@ class License():
     def simplify_license(self, expr):
         try:
             aliased = compatible_license_short(expr, self.update_dual)
-            parsed = self.parser.parse_license([aliased])
+            parsed = self._parse_license(aliased)
             simplified = str(parsed['simplified'])
             return {
                 "original": expr,
@@ -4,10 +4,16 @@
 
 
 import logging
+import re
+import sys
+
 import license_expression
+import osadl_matrix
 
 from flict.flictlib.return_codes import FlictError, ReturnCodes
 
+from flame.license_db import FossLicenses # noqa: I900
+
 from enum import Enum
 
 
@@ -16,30 +22,118 @@ class LicenseExpression(Enum):
     LICENSE_EXPRESSION_AND = "AND"
 
 
-class PrettyLicenseSymbol(Enum):
-    LICENSE_SYMBOL = "LicenseSymbol"
-    LICENSE_WITH_SYMBOL = "LicenseWithExceptionSymbol"
+# a license (or exception) id in a simple expression, e.g. "MIT" or "LicenseRef-foo"
+SIMPLE_LICENSE_ID = re.compile(r"[A-Za-z0-9][A-Za-z0-9.+_:-]*\Z")
+SIMPLE_KEYWORDS = ("AND", "OR", "WITH")
+
+# the Licensing object shared by all parsers, and its known license
+# keys and aliases (in lower case) mapped to the license keys
+_licensing = None
+_known_keys = None
+
+
+def known_license_symbols():
+    """
+    Returns the license symbols known to flict, i.e. the licenses
+    supported by osadl_matrix and flame, with flame's aliases for single
+    licenses. Licenses with exceptions are left out, since they are
+    parsed as a license WITH an exception.
+    """
+    flame = FossLicenses()
+    keys = {key for key in set(osadl_matrix.supported_licenses()) | set(flame.licenses()) if " " not in key}
+    names = {key.lower() for key in keys}
+    aliases = {}
+    for alias, target in flame.alias_list().items():
+        target = target.strip()
+        if target in keys and " " not in alias and alias.lower() not in names:
+            aliases.setdefault(target, []).append(alias)
+            names.add(alias.lower())
+
+    return [license_expression.LicenseSymbol(key, aliases=tuple(aliases.get(key, []))) for key in sorted(keys)]
+
+
+def shared_licensing():
+    """
+    Returns the license_expression Licensing object shared by all
+    parsers, created once with the known license symbols (see
+    known_license_symbols). Known licenses are looked up rather than
+    parsed, and resolved to their key, e.g. "mit" to "MIT".
+    """
+    global _licensing, _known_keys
+    if _licensing is None:
+        symbols = known_license_symbols()
+        _known_keys = {}
+        for symbol in symbols:
+            for name in (symbol.key,) + tuple(symbol.aliases):
+                _known_keys[name.lower()] = symbol.key
+        _licensing = license_expression.Licensing(symbols)
+    return _licensing
+
+
+class LicenseNode:
+    """A license in a parsed license expression"""
+
+    __slots__ = ('name',)
+    type = "license"  # noqa: A003
+
+    def __init__(self, name):
+        # the same few license names appear in very many nodes
+        self.name = sys.intern(name)
+
+    def to_dict(self):
+        return {
+            'type': self.type,
+            'name': self.name,
+        }
+
+    def __repr__(self):
+        return f"LicenseNode({self.name!r})"
+
+
+class OperatorNode:
+    """An operator (AND/OR), with its operands, in a parsed license expression"""
+
+    __slots__ = ('name', 'operands')
+    type = "operator"  # noqa: A003
+
+    def __init__(self, name, operands):
+        self.name = name
+        self.operands = tuple(operands)
+
+    def to_dict(self):
+        return {
+            'type': self.type,
+            'name': self.name,
+            'operands': [operand.to_dict() for operand in self.operands],
+        }
+
+    def __repr__(self):
+        return f"OperatorNode({self.name!r}, {len(self.operands)} operands)"
 
 
 class LicenseParserFactory:
 
+    parser = None
+
     @staticmethod
     def get_parser():
         # Not much of a choice really :)
-        return PrettyLicenseParser()
+        if LicenseParserFactory.parser is None:
+            LicenseParserFactory.parser = PrettyLicenseParser()
+        return LicenseParserFactory.parser
 
 
 class LicenseParser:
 
-    def __init__(self):
-        self.utils = ParseUtils()
-
     def parse_license(self, expr):
         return
 
     def licenses(self, expr):
         return
 
+    def license_nodes(self, expression):
+        return
+
     def is_operator(self, expr):
         return expr['type'] == "operator"
 
@@ -66,7 +160,10 @@ class PrettyLicenseParser(LicenseParser):
 
     def __init__(self):
         super(PrettyLicenseParser, self).__init__()
-        self.licensing = license_expression.Licensing()
+        self.licensing = shared_licensing()
+        self.known_keys = _known_keys
+        # license symbols used by the simple expression parser
+        self._symbols = {}
 
     def parse_license(self, expr):
         logging.debug(f"parse_license(\"{expr}\")")
@@ -85,79 +182,176 @@ class PrettyLicenseParser(LicenseParser):
         lic_expr = " ".join(expr).replace(")", " ) ").replace("(", " ( ")
         logging.debug(f"expression:         {lic_expr}")
 
-        parsed = self.licensing.parse(lic_expr)
-        logging.debug(f"parsed expression:  {parsed}")
+        simplified = self._parse_simple(lic_expr)
+        if simplified is None:
+            parsed = self.licensing.parse(lic_expr)
+            logging.debug(f"parsed expression:  {parsed}")
 
-        simplified = parsed.simplify()
-        logging.debug(f"parsed expression:  {simplified}")
+            simplified = parsed.simplify()
+            logging.debug(f"simplified expression:  {simplified}")
 
-        pretty = self.licensing.parse(simplified).pretty()
-        logging.debug(f"pretty expression:  {pretty}")
+        tree = self._expression_to_tree(simplified)
+        unknown = self.unknown_licenses(tree)
+        if unknown:
+            logging.debug(f"unknown licenses:   {unknown}")
 
-        trimmed = pretty.replace("\n", "")
-        logging.debug(f"trimmed expression: {trimmed}")
-
-        logging.debug(f"parse_license(\"{expr}\") => {trimmed}")
         return {
-            'license': self._parse_license(trimmed),
+            'license': tree,
             'original': lic_expr,
             'simplified': simplified,
-            'pretty': pretty,
-            'trimmed': trimmed,
+            'unknown': unknown,
         }
 
-    def _parse_license(self, expr):
-        logging.info(f"_parse_license(\"{expr}\")")
-
-        is_operator = self.utils.is_operator(expr)
-
-        if is_operator:
+    def unknown_licenses(self, expr):
+        """
+        Returns the licenses (list) in the parsed expression that are not
+        known, see known_license_symbols. Exceptions are not included.
 
-            op = self.utils.next_operator(expr)
-            rest = expr[len(op):]
+        Parameters:
+            expr - parsed license expression, the 'license' item from parse_license
+        """
+        unknown = set()
+        self._unknown_licenses(expr, unknown)
+        return sorted(unknown)
+
+    def _unknown_licenses(self, expr, unknown):
+        if self.is_license(expr):
+            lic = expr['name'].split(" WITH ")[0]
+            if lic.lower() not in self.known_keys:
+                unknown.add(lic)
+        else:
+            for operand in expr['operands']:
+                self._unknown_licenses(operand, unknown)
 
-            # find last parenthesis and
-            rest = rest[1:self.utils.index_last_parenthesis(rest)].strip()
+    def _parse_simple(self, lic_expr):
+        """
+        Parses and simplifies a simple license expression, i.e. a license
+        (possibly WITH an exception) or such licenses combined with only
+        AND or only OR, without using license_expression's parser.
 
-            operands = []
+        Returns the simplified expression, the same as from
+        license_expression, or None if the expression is not simple.
 
+        Parameters:
+            lic_expr - license expression (str)
+        """
+        tokens = lic_expr.split()
+        operator = None
+        terms = set()
+        index = 0
+        while True:
+            if index == len(tokens) or not self._simple_license_id(tokens[index]):
+                return None
+            term = (self.known_keys.get(tokens[index].lower(), tokens[index]), None)
+            index += 1
+
+            if index < len(tokens) and tokens[index].upper() == "WITH":
+                if index + 1 == len(tokens) or not self._simple_license_id(tokens[index + 1]):
+                    return None
+                term = (term[0], self.known_keys.get(tokens[index + 1].lower(), tokens[index + 1]))
+                index += 2
+            terms.add(term)
+
+            if index == len(tokens):
+                break
+            token = tokens[index].upper()
+            if token not in ("AND", "OR") or operator not in (None, token):
+                return None
+            operator = token
+            index += 1
+
+        # as simplify(): remove duplicates and sort the operands
+        symbols = [self._symbol(term) for term in sorted(terms, key=lambda term: term[0] if term[1] is None else f"{term[0]} WITH {term[1]}")]
+        if len(symbols) == 1:
+            return symbols[0]
+        if operator == LicenseExpression.LICENSE_EXPRESSION_AND.value:
+            return self.licensing.AND(*symbols)
+        return self.licensing.OR(*symbols)
+
+    def _symbol(self, term):
+        """Returns the (cached) license symbol for a (license, exception) term"""
+        symbol = self._symbols.get(term)
+        if symbol is None:
+            symbol = license_expression.LicenseSymbol(term[0])
+            if term[1] is not None:
+                exception = license_expression.LicenseSymbol(term[1], is_exception=True)
+                symbol = license_expression.LicenseWithExceptionSymbol(symbol, exception)
+            self._symbols[term] = symbol
+        return symbol
+
+    def _simple_license_id(self, token):
+        return SIMPLE_LICENSE_ID.match(token) is not None and token.upper() not in SIMPLE_KEYWORDS
+
+    def _expression_to_tree(self, expression):
+        """Transforms a (parsed) license_expression object to flict's
+        tree of operators and licenses, visiting every node once."""
+        if isinstance(expression, license_expression.LicenseWithExceptionSymbol):
+            return {
+                'type': 'license',
+                'name': f'{expression.license_symbol.key} WITH {expression.exception_symbol.key}',
+            }
+
+        if isinstance(expression, license_expression.LicenseSymbol):
+            return {
+                'type': 'license',
+                'name': expression.key,
+            }
+
+        if isinstance(expression, self.licensing.AND):
+            op = LicenseExpression.LICENSE_EXPRESSION_AND.value
+        elif isinstance(expression, self.licensing.OR):
+            op = LicenseExpression.LICENSE_EXPRESSION_OR.value
         else:
-            rest = expr
-
-        while (rest != ""):
-            if self.utils.is_license(rest):
-                lic, rest = self.utils.get_license(rest)
-                if lic == '':
-                    continue
-                operand = {
-                    'type': 'license',
-                    'name': lic,
-                }
-
-                if (is_operator):
-                    operands.append(operand)
-                else:
-                    return operand
-            elif self.utils.is_operator(rest):
-                operation, rest = self.utils._get_op_expr(rest)
-                logging.info(f"  operation: {operation}")
-                parsed = self._parse_license(operation)
-                operands.append(parsed)
-            elif self.utils.next_token(rest) == ",":
-                rest = self.utils.remove_comma(rest)
-            elif self.utils.next_token(rest) == PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value:
-                lic, rest = self.utils.get_license(rest)
-            else:
-                logging.error("*** PANIC IN DETROIT ***")
-                logging.error(rest)
-                raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
-                                 f"Internal error: Remaining expression not valid: {rest}")
+            raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                             f"Internal error: Expression not valid: {expression}")
+
         return {
             'type': 'operator',
             'name': op,
-            'operands': operands,
+            'operands': [self._expression_to_tree(arg) for arg in expression.args],
         }
 
+    def license_nodes(self, expression):
+        """
+        Transforms a (parsed) license_expression object to a tree of
+        LicenseNode and OperatorNode objects.
+
+        Identical subexpressions are interned into one and the same node
+        (hash-consing), so the tree is a DAG growing with the number of
+        distinct subexpressions and not with the size of the expression.
+
+        Parameters:
+            expression - parsed license expression, e.g. the 'simplified' item from parse_license
+        """
+        return self._expression_to_node(expression, {})
+
+    def _expression_to_node(self, expression, nodes):
+        if isinstance(expression, license_expression.LicenseWithExceptionSymbol):
+            name = f'{expression.license_symbol.key} WITH {expression.exception_symbol.key}'
+            key = (LicenseNode.type, name)
+            operands = None
+        elif isinstance(expression, license_expression.LicenseSymbol):
+            name = expression.key
+            key = (LicenseNode.type, name)
+            operands = None
+        else:
+            if isinstance(expression, self.licensing.AND):
+                name = LicenseExpression.LICENSE_EXPRESSION_AND.value
+            elif isinstance(expression, self.licensing.OR):
+                name = LicenseExpression.LICENSE_EXPRESSION_OR.value
+            else:
+                raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                                 f"Internal error: Expression not valid: {expression}")
+            operands = [self._expression_to_node(arg, nodes) for arg in expression.args]
+            # the operands are interned, so their identities are enough as key
+            key = (OperatorNode.type, name, tuple(id(operand) for operand in operands))
+
+        node = nodes.get(key)
+        if node is None:
+            node = LicenseNode(name) if operands is None else OperatorNode(name, operands)
+            nodes[key] = node
+        return node
+
     def licenses(self, expr):
         """
         Given a license expression, the licenses in the expression is returned as a list.
@@ -171,91 +365,25 @@ class PrettyLicenseParser(LicenseParser):
           will return:
             'GPL-2.0-or-later', 'Zlib', 'FTL', 'Libpng'
         """
+        logging.debug(f"licenses(\"{expr}\")")
+        # keep a license and its exception together, whatever the case
+        # of "with" (the same as when caching, see canonical_expression)
+        expr = re.sub(r"\s+with\s+", " WITH ", expr, flags=re.IGNORECASE)
+        simple = self._parse_simple(expr)
+        if isinstance(simple, self.licensing.AND) or isinstance(simple, self.licensing.OR):
+            return list({str(symbol) for symbol in simple.args})
+        if simple is not None:
+            return [str(simple)]
+
         try:
-            logging.debug(f"licenses(\"{expr}\")")
             parsed = self.licensing.parse(expr.replace(" WITH ", "_WITH_"))
             keys = self.licensing.license_keys(parsed)
             key_set = set()
             for key in keys:
-                key_set.add(key.replace("_WITH_", " WITH "))
+                if "_WITH_" in key:
+                    # resolve the license and the exception, as done for other keys
+                    key = " WITH ".join(self.known_keys.get(part.lower(), part) for part in key.split("_WITH_"))
+                key_set.add(key)
             return list(key_set)
         except Exception:
             raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION, f"Could not parse and list license expression: {expr}")
-
-
-class ParseUtils:
-
-    def _find_expr_end(self, expr):
-        logging.debug(f"_find_expr_end(\"{expr}\")")
-
-        first_found = False
-        paren_count = 0
-        size = 0
-        for tok in expr:
-            if tok == "(":
-                paren_count += 1
-                first_found = True
-            elif tok == ")":
-                paren_count -= 1
-
-            size += 1
-            if paren_count == 0 and first_found:
-                index = 0
-                return size + index
-
-        raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION, f"Internal error: Could not find end of expression: {expr}")
-
-    def next_token(self, expr):
-        for i in range(len(expr)):
-            if i == " " or i == "\n":
-                pass
-            else:
-                if expr.startswith(LicenseExpression.LICENSE_EXPRESSION_OR.value):
-                    return LicenseExpression.LICENSE_EXPRESSION_OR.value
-                elif expr.startswith(LicenseExpression.LICENSE_EXPRESSION_AND.value):
-                    return LicenseExpression.LICENSE_EXPRESSION_AND.value
-                elif expr.startswith(PrettyLicenseSymbol.LICENSE_SYMBOL.value):
-                    return PrettyLicenseSymbol.LICENSE_SYMBOL.value
-                elif expr.startswith(PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value):
-                    return PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value
-
-                return expr[i]
-
-    def next_operator(self, expr):
-        token = self.next_token(expr)
-        if token == LicenseExpression.LICENSE_EXPRESSION_OR.value or token == LicenseExpression.LICENSE_EXPRESSION_AND.value:
-            return token
-        return None
-
-    def is_operator(self, expr):
-        return self.next_operator(expr) is not None
-
-    def is_license(self, expr):
-        return expr.startswith(PrettyLicenseSymbol.LICENSE_SYMBOL.value) or expr.startswith(PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value)
-
-    def is_with(self, expr):
-        return expr.startswith(PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value)
-
-    def remove_comma(self, expr):
-        stripped = expr.strip()
-        return stripped[1:].strip()
-
-    def _get_op_expr(self, expr):
-        expr = expr.strip()
-        index = self._find_expr_end(expr)
-        operation = expr[:index]
-        rest = expr[index:]
-        return (operation, rest)
-
-    def get_license(self, expr):
-        index = expr.index(")")
-        if PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value in expr:
-            lic = expr[len(PrettyLicenseSymbol.LICENSE_WITH_SYMBOL.value) + 1:index].replace("'", "")
-        elif PrettyLicenseSymbol.LICENSE_SYMBOL.value in expr:
-            lic = expr[len(PrettyLicenseSymbol.LICENSE_SYMBOL.value) + 1:index].replace("'", "")
-
-        rest = expr[index + 1:]
-        return (lic, rest)
-
-    def index_last_parenthesis(self, expr):
-        return expr.rfind(")")
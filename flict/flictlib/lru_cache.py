@@ -0,0 +1,65 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded LRU cache.
+
+    When the cache is full, the least recently used value is
+    evicted. The number of hits, misses and evictions are counted.
+    """
+
+    def __init__(self, maxsize):
+        """Parameters:
+               maxsize - max number of values to keep, 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the value stored for key, None if not found"""
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self._results[key] = result
+        self._results.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self):
+        while len(self._results) > max(self.maxsize, 0):
+            self._results.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def statistics(self):
+        """Returns the cache statistics (dict)"""
+        return {
+            'size': len(self._results),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,529 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+
+import osadl_matrix
+
+from flict.flictlib.disk_cache import cache_key
+from flict.flictlib.return_codes import FlictError, ReturnCodes
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+#
+# Compact codes for the cells in the compatibility matrix. A cell
+# that is not present in the matrix is stored as MATRIX_UNDEFINED (0)
+# so that a zero initialised table means "nothing known".
+#
+MATRIX_UNDEFINED = 0
+MATRIX_YES = 1
+MATRIX_NO = 2
+MATRIX_UNKNOWN = 3
+MATRIX_CHECKDEP = 4
+
+MATRIX_TEXT_CODES = {
+    'Yes': MATRIX_YES,
+    'Same': MATRIX_YES,
+    'No': MATRIX_NO,
+    'Unknown': MATRIX_UNKNOWN,
+    'Check dependency': MATRIX_CHECKDEP,
+}
+
+MATRIX_CODE_TEXTS = {
+    MATRIX_UNDEFINED: 'Undefined',
+    MATRIX_YES: 'Yes',
+    MATRIX_NO: 'No',
+    MATRIX_UNKNOWN: 'Unknown',
+    MATRIX_CHECKDEP: 'Check dependency',
+}
+
+MATRIX_META_KEYS = ('timestamp', 'timeformat')
+
+#
+# Compiled (binary) matrix format, all integers little endian:
+#
+#   header:  magic (8 bytes), version (uint32), number of licenses (uint32),
+#            size of license name table (uint32), size of meta data (uint32)
+#   names:   license names (UTF-8), separated by newline
+#   meta:    meta data (JSON, UTF-8)
+#   codes:   number of licenses ^ 2 codes (one byte each), row is outbound
+#
+COMPILED_MATRIX_MAGIC = b'FLICTMX\0'
+COMPILED_MATRIX_VERSION = 1
+COMPILED_MATRIX_HEADER = struct.Struct('<8sIIII')
+
+
+def text_to_code(text):
+    """Returns the matrix code for a compatibility text as found in
+    OSADL's matrix, e.g. "Yes" or "Check dependency"."""
+    return MATRIX_TEXT_CODES.get(text, MATRIX_UNDEFINED)
+
+
+class CompatibilityMatrix:
+    """Pre-indexed license compatibility matrix.
+
+    The licenses are stored in a list, with a dict mapping each
+    license to its index (id). The compatibility between an outbound
+    and an inbound license is stored in a flat (row major) table of
+    codes, so a lookup is two dict hits and one table read.
+    """
+
+    def __init__(self, licenses, codes, meta=None):
+        """Parameters:
+               licenses - list of licenses, index in list is the license id
+               codes - flat bytes like object (len(licenses)^2) with codes, row is outbound
+               meta - dict with meta information (e.g. timestamp) about the matrix
+        """
+        self.licenses = licenses
+        self.size = len(licenses)
+        self.index = {lic: idx for idx, lic in enumerate(licenses)}
+        self.codes = codes
+        self.meta = meta or {}
+        self._table = None
+        self._inbound_bits = None
+        self._outbound_bits = None
+        self._digest = None
+
+    @staticmethod
+    def from_data(data):
+        """Creates a matrix from a dict, as stored in OSADL's JSON matrix."""
+        meta = {key: data[key] for key in MATRIX_META_KEYS if key in data}
+        licenses = [key for key in data.keys() if key not in MATRIX_META_KEYS]
+        size = len(licenses)
+        index = {lic: idx for idx, lic in enumerate(licenses)}
+        codes = bytearray(size * size)
+        for outbound, inbounds in ((lic, data[lic]) for lic in licenses):
+            offset = index[outbound] * size
+            for inbound, text in inbounds.items():
+                inbound_id = index.get(inbound)
+                if inbound_id is not None:
+                    codes[offset + inbound_id] = text_to_code(text)
+        return CompatibilityMatrix(licenses, codes, meta)
+
+    @staticmethod
+    def from_file(file_name):
+        """Creates a matrix from a file (JSON or CSV) using OSADL's format."""
+        return CompatibilityMatrix.from_data(read_matrix_data(file_name))
+
+    @staticmethod
+    def from_compiled_file(file_name):
+        """Creates a matrix from a compiled matrix file. The file is
+        memory mapped so only the parts of the table that are used are
+        read from disk."""
+        header_size = COMPILED_MATRIX_HEADER.size
+        with open(file_name, 'rb') as fp:
+            # an empty file can not be mapped, check the size first
+            if os.fstat(fp.fileno()).st_size < header_size:
+                raise FlictError(ReturnCodes.RET_INVALID_MATRIX, f'File "{file_name}" is not a compiled matrix')
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, size, names_size, meta_size = COMPILED_MATRIX_HEADER.unpack_from(mapped)
+        if magic != COMPILED_MATRIX_MAGIC:
+            raise FlictError(ReturnCodes.RET_INVALID_MATRIX, f'File "{file_name}" is not a compiled matrix')
+        if version != COMPILED_MATRIX_VERSION:
+            raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
+                             f'Compiled matrix "{file_name}" has version {version}, supported version is {COMPILED_MATRIX_VERSION}. Compile the matrix again.')
+
+        names_offset = header_size
+        meta_offset = names_offset + names_size
+        codes_offset = meta_offset + meta_size
+        if len(mapped) != codes_offset + size * size:
+            raise FlictError(ReturnCodes.RET_INVALID_MATRIX, f'Compiled matrix "{file_name}" is truncated or corrupt')
+
+        names = mapped[names_offset:meta_offset].decode('utf-8')
+        licenses = names.split('\n') if size else []
+        meta = json.loads(mapped[meta_offset:codes_offset].decode('utf-8'))
+        codes = memoryview(mapped)[codes_offset:]
+        return CompatibilityMatrix(licenses, codes, meta)
+
+    def write_compiled(self, file_name):
+        """Writes the matrix, in the compiled format, to file_name."""
+        names = '\n'.join(self.licenses).encode('utf-8')
+        meta = json.dumps(self.meta).encode('utf-8')
+        header = COMPILED_MATRIX_HEADER.pack(COMPILED_MATRIX_MAGIC, COMPILED_MATRIX_VERSION, self.size, len(names), len(meta))
+
+        # write to a temporary file and rename, so no process can
+        # map a half written matrix
+        tmp_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(tmp_file_name, 'wb') as fp:
+            fp.write(header)
+            fp.write(names)
+            fp.write(meta)
+            fp.write(self.codes)
+        os.replace(tmp_file_name, file_name)
+
+    def digest(self):
+        """Returns a digest (hex str) of the licenses and codes in the matrix"""
+        if self._digest is None:
+            digest = hashlib.sha256()
+            digest.update('\n'.join(self.licenses).encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(self.codes)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def compatible_counts(self, licenses):
+        """Returns a list with, for every license in licenses, the
+        number of licenses in licenses it is compatible (Yes) with as
+        inbound, i.e. the column sums of the matrix"""
+        ids = [self.index.get(lic) for lic in licenses]
+        supported_ids = [license_id for license_id in ids if license_id is not None]
+        table = self.table()
+        if table is not None:
+            column_sums = (table[numpy.ix_(supported_ids, supported_ids)] == MATRIX_YES).sum(axis=0).tolist()
+            counts = dict(zip(supported_ids, column_sums))
+        else:
+            mask = 0
+            for license_id in supported_ids:
+                mask |= 1 << license_id
+            counts = {license_id: bin(self.outbound_bits(license_id) & mask).count('1') for license_id in supported_ids}
+        return [counts.get(license_id, 0) for license_id in ids]
+
+    def license_id(self, lic):
+        """Returns the id of the license, None if not supported"""
+        return self.index.get(lic)
+
+    def supported(self, lic):
+        return lic in self.index
+
+    def code(self, outbound, inbound):
+        """Returns the code for the compatibility between outbound and
+        inbound. MATRIX_UNDEFINED is returned if any of the licenses
+        are not supported."""
+        outbound_id = self.index.get(outbound)
+        inbound_id = self.index.get(inbound)
+        if outbound_id is None or inbound_id is None:
+            return MATRIX_UNDEFINED
+        return self.code_by_id(outbound_id, inbound_id)
+
+    def code_by_id(self, outbound_id, inbound_id):
+        return self.codes[outbound_id * self.size + inbound_id]
+
+    def row(self, outbound_id):
+        """Returns the codes for all inbound licenses for outbound_id"""
+        offset = outbound_id * self.size
+        return self.codes[offset:offset + self.size]
+
+    def inbound_bits(self, outbound_id):
+        """Returns a bitset (int), with bit n set if the license with id n
+        is compatible (Yes) as inbound to outbound_id"""
+        if self._inbound_bits is None:
+            self._create_bitsets()
+        return self._inbound_bits[outbound_id]
+
+    def outbound_bits(self, inbound_id):
+        """Returns a bitset (int), with bit n set if inbound_id is
+        compatible (Yes) as inbound to the license with id n"""
+        if self._outbound_bits is None:
+            self._create_bitsets()
+        return self._outbound_bits[inbound_id]
+
+    def license_bits(self, licenses):
+        """Returns a bitset (int) with the bits for the supported licenses
+        in licenses set"""
+        bits = 0
+        for lic in licenses:
+            license_id = self.index.get(lic)
+            if license_id is not None:
+                bits |= 1 << license_id
+        return bits
+
+    def bits_licenses(self, bits):
+        """Returns a list of the licenses set in the bitset"""
+        licenses = []
+        while bits:
+            low_bit = bits & -bits
+            licenses.append(self.licenses[low_bit.bit_length() - 1])
+            bits ^= low_bit
+        return licenses
+
+    def _create_bitsets(self):
+        table = self.table()
+        if table is not None:
+            compatible = table == MATRIX_YES
+            self._inbound_bits = [_bool_row_to_bits(row) for row in compatible]
+            self._outbound_bits = [_bool_row_to_bits(column) for column in compatible.T]
+            return
+
+        inbound_bits = [0] * self.size
+        outbound_bits = [0] * self.size
+        for outbound_id in range(self.size):
+            row = self.row(outbound_id)
+            for inbound_id in range(self.size):
+                if row[inbound_id] == MATRIX_YES:
+                    inbound_bits[outbound_id] |= 1 << inbound_id
+                    outbound_bits[inbound_id] |= 1 << outbound_id
+        self._inbound_bits = inbound_bits
+        self._outbound_bits = outbound_bits
+
+    def table(self):
+        """Returns a 2D numpy view (no copy) of the codes, or None if numpy
+        is not available."""
+        if numpy is None:
+            return None
+        if self._table is None:
+            self._table = numpy.frombuffer(self.codes, dtype=numpy.uint8).reshape(self.size, self.size)
+        return self._table
+
+
+class LayeredMatrix(CompatibilityMatrix):
+    """Matrix with one or more sparse overlays on top of a base matrix.
+
+    The overlays add licenses and override cells of the base
+    matrix. Only the cells in the overlays are stored. Cells not found
+    in any overlay are looked up in the base matrix and, if not found
+    there either, the default is used (No or Undefined).
+    """
+
+    def __init__(self, base, overlays, default_no=False):
+        """Parameters:
+               base - CompatibilityMatrix to put the overlays on top of
+               overlays - list of dicts, as in OSADL's JSON matrix, applied in order
+               default_no - use No, instead of Undefined, for missing cells
+        """
+        self.base = base
+        self.default_code = MATRIX_NO if default_no else MATRIX_UNDEFINED
+        self.licenses = list(base.licenses)
+        self.index = dict(base.index)
+        self.meta = base.meta
+        for overlay in overlays:
+            for lic in overlay.keys():
+                if lic not in self.index:
+                    self.index[lic] = len(self.licenses)
+                    self.licenses.append(lic)
+        self.size = len(self.licenses)
+
+        # the overlay cells, outbound id -> inbound id -> code
+        self._cells = {}
+        for overlay in overlays:
+            for outbound, inbounds in overlay.items():
+                row = self._cells.setdefault(self.index[outbound], {})
+                for inbound, text in inbounds.items():
+                    inbound_id = self.index.get(inbound)
+                    if inbound_id is None:
+                        logging.warning(f'Ignoring compatibility between "{outbound}" and "{inbound}" since "{inbound}" is not in the matrix')
+                        continue
+                    row[inbound_id] = text_to_code(text)
+
+        self._codes = None
+        self._table = None
+        self._inbound_bits = None
+        self._outbound_bits = None
+        self._digest = cache_key(base.digest(), json.dumps(overlays, sort_keys=True), str(default_no))
+
+    @property
+    def codes(self):
+        """The full table of codes, created (once) from the base matrix and overlays"""
+        if self._codes is None:
+            self._codes = b''.join(self.row(outbound_id) for outbound_id in range(self.size))
+        return self._codes
+
+    def digest(self):
+        return self._digest
+
+    def code_by_id(self, outbound_id, inbound_id):
+        row = self._cells.get(outbound_id)
+        if row is not None:
+            code = row.get(inbound_id)
+            if code is not None:
+                return code
+        if outbound_id < self.base.size and inbound_id < self.base.size:
+            code = self.base.code_by_id(outbound_id, inbound_id)
+            if code != MATRIX_UNDEFINED:
+                return code
+        return self.default_code
+
+    def row(self, outbound_id):
+        if outbound_id < self.base.size:
+            row = bytearray(self.base.row(outbound_id))
+            if self.default_code != MATRIX_UNDEFINED:
+                row = row.replace(bytes([MATRIX_UNDEFINED]), bytes([self.default_code]))
+            row += bytes([self.default_code]) * (self.size - self.base.size)
+        else:
+            row = bytearray([self.default_code]) * self.size
+        for inbound_id, code in self._cells.get(outbound_id, {}).items():
+            row[inbound_id] = code
+        return row
+
+
+def _bool_row_to_bits(row):
+    return int.from_bytes(numpy.packbits(row, bitorder='little').tobytes(), 'little')
+
+
+def is_compiled_matrix(file_name):
+    """Returns True if file_name is a compiled matrix"""
+    with open(file_name, 'rb') as fp:
+        return fp.read(len(COMPILED_MATRIX_MAGIC)) == COMPILED_MATRIX_MAGIC
+
+
+def read_matrix_data(file_name):
+    """Reads a matrix file (JSON or CSV) using OSADL's format into a dict"""
+    with open(file_name) as fp:
+        try:
+            return json.load(fp)
+        except json.JSONDecodeError:
+            fp.seek(0)
+            return _read_csv_data(fp)
+
+
+def validate_matrix_data(data):
+    """Validates the completeness of matrix data (dict, as in OSADL's
+    JSON matrix). Every license must have a compatibility defined with
+    every license, and only with licenses in the matrix.
+
+    All violations are reported, as a dict:
+        valid - True if no violations were found
+        licenses - number of licenses in the matrix
+        missing_cells - number of missing cells
+        missing - outbound license -> inbound licenses without compatibility
+        not_in_matrix - outbound license -> inbound licenses not in the matrix
+    """
+    licenses = [key for key in data.keys() if key not in MATRIX_META_KEYS]
+    license_set = set(licenses)
+    missing = {}
+    not_in_matrix = {}
+    for outbound in licenses:
+        inbounds = data[outbound].keys()
+        missing_inbounds = license_set - inbounds
+        if missing_inbounds:
+            missing[outbound] = sorted(missing_inbounds)
+        unknown_inbounds = inbounds - license_set
+        if unknown_inbounds:
+            not_in_matrix[outbound] = sorted(unknown_inbounds)
+
+    return {
+        'valid': not missing and not not_in_matrix,
+        'licenses': len(licenses),
+        'missing_cells': sum(len(inbounds) for inbounds in missing.values()),
+        'missing': missing,
+        'not_in_matrix': not_in_matrix,
+    }
+
+
+def _read_csv_data(fp):
+    """Reads a CSV matrix, as done by osadl_matrix, into a dict"""
+    data = {}
+    for row in csv.DictReader(fp, delimiter=',', quotechar='"'):
+        key = row['Compatibility*']
+        data.setdefault(key, {})
+        for inbound, value in row.items():
+            if inbound == 'Compatibility*':
+                continue
+            data[key][inbound] = value
+    return data
+
+
+def license_ranking(matrix, licenses=None):
+    """Returns the licenses (defaults to all the licenses in the matrix)
+    with the most preferred license first. The more licenses a license is
+    compatible with as inbound the more preferred it is, then in reverse
+    alphabetical order (see CompatibilityLicenseChooser)"""
+    licenses = matrix.licenses if licenses is None else licenses
+    counts = matrix.compatible_counts(licenses)
+    return [lic for _, lic in sorted(zip(counts, licenses), reverse=True)]
+
+
+def diff_matrices(old, new):
+    """Returns the differences between two matrices as a dict:
+        licenses_added - licenses only in the new matrix
+        licenses_removed - licenses only in the old matrix
+        changed - list of dicts (outbound, inbound, old, new) for the
+                  cells that differ, for licenses in both matrices
+        ranking - empty if the licenses in both matrices are preferred
+                  in the same order (see license_ranking), otherwise a
+                  dict with the old and the new order
+    """
+    common = [lic for lic in old.licenses if new.supported(lic)]
+    old_ids = [old.license_id(lic) for lic in common]
+    new_ids = [new.license_id(lic) for lic in common]
+
+    old_table = old.table()
+    new_table = new.table()
+    if old_table is not None and new_table is not None:
+        old_codes = old_table[numpy.ix_(old_ids, old_ids)]
+        new_codes = new_table[numpy.ix_(new_ids, new_ids)]
+        changed_cells = [(int(row), int(column)) for row, column in numpy.argwhere(old_codes != new_codes)]
+        old_changed = [int(old_codes[cell]) for cell in changed_cells]
+        new_changed = [int(new_codes[cell]) for cell in changed_cells]
+    else:
+        changed_cells = []
+        old_changed = []
+        new_changed = []
+        for row, (old_id, new_id) in enumerate(zip(old_ids, new_ids)):
+            old_row = old.row(old_id)
+            new_row = new.row(new_id)
+            for column, (old_inbound_id, new_inbound_id) in enumerate(zip(old_ids, new_ids)):
+                if old_row[old_inbound_id] != new_row[new_inbound_id]:
+                    changed_cells.append((row, column))
+                    old_changed.append(old_row[old_inbound_id])
+                    new_changed.append(new_row[new_inbound_id])
+
+    old_ranking = [lic for lic in license_ranking(old) if new.supported(lic)]
+    new_ranking = [lic for lic in license_ranking(new) if old.supported(lic)]
+
+    return {
+        'licenses_added': [lic for lic in new.licenses if not old.supported(lic)],
+        'licenses_removed': [lic for lic in old.licenses if not new.supported(lic)],
+        'changed': [{
+            'outbound': common[row],
+            'inbound': common[column],
+            'old': MATRIX_CODE_TEXTS[old_code],
+            'new': MATRIX_CODE_TEXTS[new_code],
+        } for (row, column), old_code, new_code in zip(changed_cells, old_changed, new_changed)],
+        'ranking': {'old': old_ranking, 'new': new_ranking} if old_ranking != new_ranking else {},
+    }
+
+
+def read_overlay(file_name):
+    """Reads an overlay, i.e. additional licenses as used when merging
+    (see SETTINGS.md), from file_name"""
+    try:
+        with open(file_name) as fp:
+            return json.load(fp)['osadl_additional_licenses']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        raise FlictError(ReturnCodes.RET_INVALID_MATRIX,
+                         f'File "{file_name}" does not contain additional licenses ("osadl_additional_licenses")')
+    except (FileNotFoundError, IsADirectoryError):
+        raise FlictError(ReturnCodes.RET_FILE_NOT_FOUND, f'File "{file_name}" could not be found or is a directory')
+
+
+_matrices = {}
+
+
+def load_matrix(license_db=None, overlay_files=None, default_no=False):
+    """Returns the matrix for the license db (file name). The matrix is
+    only read once per file and process.
+
+        Parameters:
+            license_db: file with matrix, defaults to OSADL's matrix
+            overlay_files: files with additional licenses to put on top of the matrix
+            default_no: use No for cells missing in the matrix and overlays
+    """
+    file_name = os.path.realpath(license_db or osadl_matrix.OSADL_MATRIX_JSON)
+    if file_name not in _matrices:
+        if is_compiled_matrix(file_name):
+            _matrices[file_name] = CompatibilityMatrix.from_compiled_file(file_name)
+        else:
+            _matrices[file_name] = CompatibilityMatrix.from_file(file_name)
+
+    if not overlay_files and not default_no:
+        return _matrices[file_name]
+
+    # default_no without overlays is a layered matrix without overlays,
+    # i.e. the missing cells of the matrix are No
+    overlay_files = overlay_files or []
+    key = (file_name, tuple(os.path.realpath(overlay) for overlay in overlay_files), default_no)
+    if key not in _matrices:
+        overlays = [read_overlay(overlay) for overlay in overlay_files]
+        _matrices[key] = LayeredMatrix(_matrices[file_name], overlays, default_no)
+    return _matrices[key]
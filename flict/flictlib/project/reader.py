@@ -7,7 +7,7 @@ import json
 import logging
 
 from flict.flictlib.return_codes import FlictError, ReturnCodes
-from flict.flictlib.license import compatible_license
+from flict.flictlib.license import normalize_licenses
 
 DEPENDENCY_TAGS = ['DYNAMIC_LINK', 'STATIC_LINK', 'DEPENDS_ON', 'CONTAINS', 'COPY_OF']
 
@@ -49,18 +49,27 @@ class ProjectReader:
         return project_file in self.files_read
 
     def prepare_project(self, project):
+        """Replaces the license of all packages, and their dependencies,
+        with the normalized license. The original license is kept as
+        'original_license'.
+
+        The distinct licenses are collected first and normalized in one
+        batch, see normalize_licenses.
+        """
+        packages = {}
         for package in project.get('packages', []):
-            self.__update_dep_license(package)
-        return project
+            self.__collect_packages(package, packages)
 
-    def __update_dep_license(self, package):
-        package['original_license'] = package.get('license')
-        compat = compatible_license(package.get('license'), update_dual=self.update_dual)
-        fixed_license = compat['compat_license']
-        package['license'] = fixed_license
+        normalized = normalize_licenses([package.get('license') for package in packages.values()], update_dual=self.update_dual)
+        for package in packages.values():
+            package['original_license'] = package.get('license')
+            package['license'] = normalized[package['original_license']]
+        return project
 
+    def __collect_packages(self, package, packages):
+        packages[id(package)] = package
         for dep in package['dependencies']:
-            self.__update_dep_license(dep)
+            self.__collect_packages(dep, packages)
 
     def _flatten_packages(self, packages):
         package_list = []
@@ -10,6 +10,26 @@ def timestamp():
     return str(datetime.datetime.now())
 
 
+def compatibility_index(compatibility):
+    """Returns a dict with the position, in a package info's compatibility
+    list, of the check of each outbound license"""
+    return {compat['outbound']['name']: index for index, compat in enumerate(compatibility)}
+
+
+def outbound_compatibility(package_info, outbound):
+    """Returns the check of the outbound license in the package info's
+    compatibility list, None if the outbound license was not checked.
+    Package infos without a compatibility index (e.g. from reports
+    created by older versions) are indexed on the fly."""
+    index = package_info.get('compatibility_index')
+    if index is None:
+        index = compatibility_index(package_info['compatibility'])
+    position = index.get(outbound)
+    if position is None:
+        return None
+    return package_info['compatibility'][position]
+
+
 def meta_information(start_time=""):
     uname = os.uname()
     return {
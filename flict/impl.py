@@ -14,9 +14,13 @@ from flict.flictlib.return_codes import FlictError, ReturnCodes
 
 from flict.flictlib.arbiter import Arbiter
 from flict.flictlib.format.factory import FormatterFactory
+from flict.flictlib.impact import ImpactIndex
+from flict.flictlib.matrix import diff_matrices
+from flict.flictlib.matrix import load_matrix
 from flict.flictlib.project.reader import ProjectReaderFactory
 
 import json
+import sys
 
 
 class FlictImpl:
@@ -29,6 +33,26 @@ class FlictImpl:
     def merge_license_db(self):
         return self.arbiter.extend_license_db(self._args.license_file, oformat=self._args.output_format, default_no=self._args.default_no)
 
+    def compile_matrix(self):
+        self.arbiter.compile_license_db(self._args.compiled_matrix_file)
+
+    def validate_matrix(self):
+        report = self.arbiter.validate_license_db()
+        return_code = ReturnCodes.RET_SUCCESS if report['valid'] else ReturnCodes.RET_INVALID_MATRIX
+        return self._formatter.format_matrix_validation(report), return_code
+
+    def diff_matrix(self):
+        old_matrix = load_matrix(self._args.old_matrix_file)
+        new_matrix = load_matrix(self._args.new_matrix_file or self._args.license_matrix_file)
+        diff = diff_matrices(old_matrix, new_matrix)
+
+        impact_index = ImpactIndex()
+        for report_file in self._args.report_files:
+            impact_index.add_report_file(report_file)
+        diff['impacted'] = impact_index.impacted(diff)
+
+        return self._formatter.format_matrix_diff(diff)
+
     def display_compatibility(self):
         compat_list = []
         for lic in self._args.license_expression:
@@ -40,6 +64,12 @@ class FlictImpl:
         simplified = self.arbiter.simplify_license(" ".join(self._args.license_expression))
         return self._formatter.format_simplified(simplified)
 
+    def normalize(self):
+        license_expressions = self._args.license_expression or [line.strip() for line in sys.stdin]
+        license_expressions = [expr for expr in license_expressions if expr]
+        normalized = self.arbiter.normalize_licenses(license_expressions)
+        return self._formatter.format_normalized([{'original': expr, 'normalized': normalized[expr]} for expr in license_expressions])
+
     def suggest_outbound_candidate(self):
         license_expression = self._args.license_expression
 
@@ -53,13 +83,9 @@ class FlictImpl:
 
         lic_expr_list = [license_expression] if isinstance(license_expression, str) else license_expression
 
-        outbounds = []
         try:
-            for outbound in allowed_licenses:
-                compats = self.arbiter.inbounds_outbound_check(outbound, lic_expr_list)
-                compat = compats['compatibility'] == 'Yes'
-                if compat:
-                    outbounds.append(outbound)
+            # evaluate the expression once, for all outbounds at once
+            outbounds = self.arbiter.compatible_outbounds(lic_expr_list, allowed_licenses)
 
             outbounds.sort()
             return self._formatter.format_outbound_license(outbounds)
@@ -75,9 +101,19 @@ class FlictImpl:
 
     def _handle_lico_project(self, reader, project_file, formatter):
         project = reader.read_project(project_file)
-        verification = self.arbiter.verify(project)
+        previous = self._read_previous_report(self._args.previous_report)
+        verification = self.arbiter.verify(project, previous=previous)
         return verification
 
+    def _read_previous_report(self, file_name):
+        if not file_name:
+            return None
+        try:
+            with open(file_name) as fp:
+                return json.load(fp)
+        except json.JSONDecodeError:
+            raise FlictError(ReturnCodes.RET_INVALID_PROJECT, f'File "{file_name}" does not contain valid JSON data')
+
     def _read_json_object(self, file_name, object_key, ret):
         if not file_name:
             return ret
@@ -101,7 +137,11 @@ class FlictImpl:
                           licenses_preferences=licenses_preferences,
                           denied_licenses=licenses_denied,
                           allowed_licenses=licenses_allowed,
-                          update_dual=not self._args.no_relicense)
+                          update_dual=not self._args.no_relicense,
+                          license_db_overlays=self._args.license_matrix_overlay_files,
+                          overlay_default_no=self._args.overlay_default_no,
+                          short_circuit=self._args.short_circuit,
+                          jobs=self._args.jobs)
 
         return arbiter
 
@@ -120,7 +160,33 @@ class FlictImpl:
             compatible = compatible and (len(package['allowed_outbound_licenses']) > 0)
         return 0 if compatible else 1
 
+    def _verify_quick(self):
+        """Returns the same return code as verify, without creating or
+        formatting a report"""
+        strict_check = not self._args.ignore_problems
+
+        if self._args.verify_flict:
+            project_reader = ProjectReaderFactory.get_projectreader(self._args.verify_flict, None, "flict")
+            project = project_reader.read_project(self._args.verify_flict)
+            verdict = self.arbiter.verify_verdict(project, check_problems=strict_check)
+        elif self._args.verify_sbom:
+            project_reader = ProjectReaderFactory.get_projectreader(self._args.verify_sbom, self._args.sbom_dirs)
+            project = project_reader.read_project(self._args.verify_sbom)
+            verdict = self.arbiter.verify_verdict(project, check_problems=strict_check)
+        elif self._args.out_license and self._args.in_license_expr:
+            verdict = self.arbiter.verify_outbound_inbound_verdict(self._args.out_license, self._args.in_license_expr, check_problems=strict_check)
+        else:
+            raise FlictError(ReturnCodes.RET_MISSING_ARGS, 'Bad verify syntax')
+
+        if strict_check and verdict['problems']:
+            raise FlictError(ReturnCodes.RET_INVALID_EXPRESSSION,
+                             f'Unknown or undefined licenses identified: {", ".join(verdict["problems"])}')
+        return 0 if verdict['compatible'] else 1
+
     def verify(self):
+        if self._args.quick:
+            return None, self._verify_quick()
+
         formatter = FormatterFactory.formatter(self._args.output_format)
         strict_check = not self._args.ignore_problems
 
@@ -40,6 +40,7 @@ setuptools.setup(
     install_requires=requirements,
     extras_require={
         'dev': requirements_dev,
+        'numpy': ['numpy'],
     },
     classifiers=[
         "Development Status :: 4 - Beta",
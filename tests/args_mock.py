@@ -16,6 +16,12 @@ class ArgsMock:
     licenses : str = None
     list_project_licenses : bool = False
     license_matrix_file : str = flict_config.DEFAULT_MATRIX_FILE
+    license_matrix_overlay_files = None
+    overlay_default_no = False
+    short_circuit = False
+    jobs = 1
+    previous_report = None
+    quick = False
     licenses_info_file = None
     in_license_expr = None
     out_license = None
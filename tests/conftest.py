@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import shutil
+import tempfile
+
+import pytest
+
+from flict.flictlib import flict_config
+
+
+def pytest_configure(config):
+    # the tests create arbiters etc when collected, before any fixture
+    # is used, so keep them from using the user's cache as well
+    config.flict_cache_dir = tempfile.mkdtemp(prefix='flict-cache-')
+    flict_config.DEFAULT_CACHE_DIR = config.flict_cache_dir
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config.flict_cache_dir, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Every test gets its own, empty, cache dir"""
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(flict_config, 'DEFAULT_CACHE_DIR', cache_dir)
+    return cache_dir
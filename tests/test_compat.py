@@ -6,11 +6,16 @@
 
 import unittest
 
+from flict.flictlib.compatibility import Compatibility
+from flict.flictlib.compatibility import CompatibilityCache
 from flict.flictlib.compatibility import CompatibilityFactory
 from flict.flictlib.compatibility import CompatibilityStatus
 from flict.flictlib.arbiter import Arbiter
 from flict.flictlib.compatibility import CompatibilityLicenseChooser
 from flict.flictlib.compatibility import CustomLicenseChooser
+from flict.flictlib.compatibility import _license_preferences
+from flict.flictlib.disk_cache import cache_key, read_cache, write_cache
+from flict.flictlib.return_codes import FlictError
 
 class TestCompatibilty(unittest.TestCase):
 
@@ -30,6 +35,58 @@ class TestCompatibilty(unittest.TestCase):
         compat = compatbility.check_compat("GPL-2.0-only", "MIT")
         self.assertEqual(CompatibilityStatus.LICENSE_COMPATIBILITY_COMPATIBLE.value, compat['compatibility'])
 
+    def test_check_compat_cached(self):
+
+        compatbility = CompatibilityFactory.get_compatibility()
+
+        compat = compatbility.check_compat("GPL-2.0-only", "BSD-3-Clause")
+        misses = compatbility.cache_statistics()['misses']
+        hits = compatbility.cache_statistics()['hits']
+        self.assertEqual(compat, compatbility.check_compat("GPL-2.0-only", "BSD-3-Clause"))
+        self.assertEqual(misses, compatbility.cache_statistics()['misses'])
+        self.assertEqual(hits + 1, compatbility.cache_statistics()['hits'])
+
+    def test_check_compatibilities(self):
+
+        compatbility = CompatibilityFactory.get_compatibility()
+        licenses = ["MIT", "GPL-2.0-only", "BSD-3-Clause", "Apache-2.0"]
+
+        compats = compatbility.check_compatibilities(licenses)
+        lefts, rights = Compatibility._compatibility_statuses(compatbility, [c['license'] for c in compats['compatibilities']], licenses)
+        for compat, left_row, right_row in zip(compats['compatibilities'], lefts, rights):
+            self.assertEqual([lic['license'] for lic in compat['licenses']], licenses)
+            self.assertEqual([lic['compatible_left'] for lic in compat['licenses']],
+                             [compatbility._compatibility_status_json(status) for status in left_row])
+            self.assertEqual([lic['compatible_right'] for lic in compat['licenses']],
+                             [compatbility._compatibility_status_json(status) for status in right_row])
+
+        with self.assertRaises(FlictError):
+            compatbility.check_compatibilities(["MIT", "NONESUCH"])
+
+class TestCompatibilityCache(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = CompatibilityCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.statistics(), {
+            'size': 2,
+            'maxsize': 2,
+            'hits': 3,
+            'misses': 1,
+            'evictions': 1,
+        })
+
+    def test_disabled(self):
+        cache = CompatibilityCache(0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+
 class TestLicenseChooser(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
@@ -55,6 +112,32 @@ class TestLicenseChooser(unittest.TestCase):
     def test_multiple_license(self):
         self.assertEqual(self.chooser.choose(['curl', 'X11', 'MIT', 'BSD-3-Clause', 'BSD-4-Clause']), 'curl')
 
+    def test_license_ranking(self):
+        licenses = self.arbiter.supported_licenses()
+        compatibility = CompatibilityFactory.get_compatibility()
+        counts = []
+        for inbound in licenses:
+            count = len([outbound for outbound in licenses if compatibility.check_compat(outbound, inbound)['compatibility'] == "Yes"])
+            counts.append((count, inbound))
+        self.assertEqual(self.chooser.list_licenses(), [lic for _, lic in sorted(counts, reverse=True)])
+
+    def test_license_ranking_cached(self):
+        licenses = ['MIT', 'GPL-2.0-only', 'BSD-3-Clause']
+        ranking = CompatibilityLicenseChooser(licenses).list_licenses()
+        self.assertEqual(read_cache(f'license-preferences-{self._ranking_key(licenses)}'), ranking)
+
+        # a ranking found on disk (as if computed by another process) is used
+        seeded = list(reversed(ranking))
+        _license_preferences.clear()
+        write_cache(f'license-preferences-{self._ranking_key(licenses)}', seeded)
+        chooser = CompatibilityLicenseChooser(licenses)
+        self.assertEqual(chooser.list_licenses(), seeded)
+        self.assertEqual(chooser.choose(ranking[:2]), ranking[1])
+        self.assertIsNone(read_cache('license-preferences-nonesuch'))
+
+    def _ranking_key(self, licenses):
+        return cache_key(CompatibilityFactory.get_compatibility().matrix.digest(), *licenses)
+
 class TestCustomLicenseChooser(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
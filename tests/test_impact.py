@@ -0,0 +1,89 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from flict.flictlib.arbiter import Arbiter
+from flict.flictlib.impact import ImpactIndex
+from flict.flictlib.matrix import diff_matrices
+from flict.flictlib.matrix import CompatibilityMatrix
+from flict.flictlib.project.reader import ProjectReaderFactory
+
+old_matrix = CompatibilityMatrix.from_data({
+    "MIT": {"MIT": "Same", "GPL-2.0-only": "No", "BSD-3-Clause": "Yes"},
+    "GPL-2.0-only": {"MIT": "Yes", "GPL-2.0-only": "Same", "BSD-3-Clause": "Yes"},
+    "BSD-3-Clause": {"MIT": "Yes", "GPL-2.0-only": "No", "BSD-3-Clause": "Same"},
+})
+
+new_matrix = CompatibilityMatrix.from_data({
+    "MIT": {"MIT": "Same", "GPL-2.0-only": "No", "X11": "Yes"},
+    "GPL-2.0-only": {"MIT": "Unknown", "GPL-2.0-only": "Same", "X11": "Yes"},
+    "X11": {"MIT": "Yes", "GPL-2.0-only": "No", "X11": "Same"},
+})
+
+
+def _report():
+    arbiter = Arbiter()
+    reader = ProjectReaderFactory.get_projectreader(project_format="spdx")
+    return arbiter.verify(reader.read_project("example-data/zlib-1.2.11.spdx.json"))
+
+
+def test_diff_matrices():
+    diff = diff_matrices(old_matrix, new_matrix)
+    assert diff['licenses_added'] == ["X11"]
+    assert diff['licenses_removed'] == ["BSD-3-Clause"]
+    assert diff['changed'] == [{
+        'outbound': "GPL-2.0-only",
+        'inbound': "MIT",
+        'old': "Yes",
+        'new': "Unknown",
+    }]
+    assert diff['ranking'] == {}
+
+
+def test_no_diff():
+    diff = diff_matrices(old_matrix, old_matrix)
+    assert diff == {'licenses_added': [], 'licenses_removed': [], 'changed': [], 'ranking': {}}
+
+
+def test_impacted():
+    report = _report()
+    index = ImpactIndex()
+    index.add_report("zlib.json", report)
+
+    package = report['packages'][0]
+    outbound = package['licenses_to_check'][0]
+    inbound = index._inbound_licenses(package).pop()
+
+    unrelated = {'licenses_added': [], 'licenses_removed': [], 'changed': [
+        {'outbound': "AGPL-3.0-only", 'inbound': "NONESUCH", 'old': "Yes", 'new': "No"},
+    ]}
+    assert index.impacted(unrelated) == []
+
+    related = {'licenses_added': [], 'licenses_removed': [], 'changed': [
+        {'outbound': outbound, 'inbound': inbound, 'old': "Yes", 'new': "No"},
+    ]}
+    impacted = index.impacted(related)
+    assert [(p['report'], p['package']) for p in impacted] == [("zlib.json", package['name'])]
+
+
+def test_ranking_impacted():
+    # MIT is compatible with more licenses than X11 in the old matrix,
+    # and the other way around in the new matrix
+    ranked_matrix = CompatibilityMatrix.from_data({
+        "MIT": {"MIT": "Same", "GPL-2.0-only": "No", "X11": "Yes"},
+        "GPL-2.0-only": {"MIT": "Yes", "GPL-2.0-only": "Same", "X11": "No"},
+        "X11": {"MIT": "Yes", "GPL-2.0-only": "No", "X11": "Same"},
+    })
+    diff = diff_matrices(ranked_matrix, new_matrix)
+    assert [(cell['outbound'], cell['inbound']) for cell in diff['changed']] == [("GPL-2.0-only", "MIT"), ("GPL-2.0-only", "X11")]
+    assert diff['ranking'] == {'old': ["MIT", "X11", "GPL-2.0-only"], 'new': ["X11", "MIT", "GPL-2.0-only"]}
+
+    report = {'packages': [
+        {'name': "dual", 'licenses_to_check': ["MIT", "X11"], 'allowed_outbound_licenses': ["MIT", "X11"]},
+        {'name': "single", 'licenses_to_check': ["MIT"], 'allowed_outbound_licenses': ["MIT"]},
+    ]}
+    index = ImpactIndex()
+    index.add_report("report.json", report)
+    impacted = index.impacted(diff)
+    assert [p['package'] for p in impacted] == ["dual"]
+    assert impacted[0]['reasons'] == ["outbound preference: MIT, X11 -> X11, MIT"]
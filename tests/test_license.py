@@ -6,6 +6,15 @@ import pytest
 
 from flict.flictlib.return_codes import FlictError
 
+from flict.flictlib import flict_config
+from flict.flictlib.arbiter import Arbiter
+from flict.flictlib.disk_cache import write_cache
+from flict.flictlib.license import canonical_expression
+from flict.flictlib.license import compatible_license
+from flict.flictlib.license import compatible_license_cache
+from flict.flictlib.license import license_cache
+from flict.flictlib.license import License
+
 from flict.flictlib.license_parser import LicenseParserFactory
 from flict.flictlib.license_parser import PrettyLicenseParser
 
@@ -13,7 +22,7 @@ from flict.flictlib.license_parser import PrettyLicenseParser
 @pytest.fixture(autouse=True)
 def parser():
     one_and_only_blessed_parser = LicenseParserFactory.get_parser()
-    assert (one_and_only_blessed_parser.utils)
+    assert isinstance(one_and_only_blessed_parser, PrettyLicenseParser)
     yield one_and_only_blessed_parser
 
 
@@ -54,3 +63,134 @@ def test_licenses_without_duplicates(parser):
 def test_licenses_with_duplicates(parser):
     license_list = parser.licenses("MIT and BSD-3-Clause AND MIT OR X11 AND MIT OR BSD-3-Clause")
     assert {'X11', 'BSD-3-Clause', 'MIT'} == set(license_list)
+
+
+@pytest.mark.parametrize('lic_expr', ['MIT AND (GPL-2.0-only WITH Classpath-exception-2.0 OR X11)', ])
+def test_license_before_with_license(parse_simple, lic_expr):
+    p = parse_simple
+    assert p["name"] == "AND"
+    assert {"type": "license", "name": "MIT"} in p["operands"]
+    assert {
+        "type": "operator",
+        "name": "OR",
+        "operands": [
+            {"type": "license", "name": "GPL-2.0-only WITH Classpath-exception-2.0"},
+            {"type": "license", "name": "X11"},
+        ],
+    } in p["operands"]
+
+
+def test_canonical_expression():
+    assert canonical_expression("X11 or MIT") == canonical_expression("MIT OR  X11")
+    assert canonical_expression("MIT AND X11 AND MIT") == "MIT AND X11"
+    assert canonical_expression("MIT WITH foo OR X11") == "MIT WITH foo OR X11"
+    assert canonical_expression("(X11 OR MIT) AND BSD-3-Clause") == "( X11 OR MIT ) AND BSD-3-Clause"
+    assert canonical_expression("X11 OR MIT AND BSD-3-Clause") == "X11 OR MIT AND BSD-3-Clause"
+
+
+def test_license_cache():
+    lic = License(None, None)
+    parsed = lic.get_license(["X11 OR MIT"])
+    hits = lic.cache_statistics()['hits']
+    assert lic.get_license(["MIT OR X11"]) == parsed
+    assert lic.cache_statistics()['hits'] == hits + 1
+
+    # modifying the returned tree must not affect the cache
+    parsed['compatibility'] = "Yes"
+    assert 'compatibility' not in lic.get_license(["X11 OR MIT"])
+
+
+def test_compiled_expression():
+    arbiter = Arbiter()
+    expr = ["X11 AND (GPL-2.0-only WITH Classpath-exception-2.0 OR MIT)"]
+    compiled = arbiter.compile_expression(expr)
+    tree = compiled.tree
+    for outbound in ["GPL-2.0-only", "MIT", "Apache-2.0"]:
+        assert arbiter.evaluate_expression(outbound, compiled).to_dict() == arbiter.inbounds_outbound_check(outbound, expr)
+    assert compiled.tree == tree
+    assert arbiter.compile_expression(expr) is compiled
+
+    with pytest.raises(AttributeError):
+        compiled.tree = None
+
+
+def test_compatible_outbounds_vector():
+    arbiter = Arbiter()
+    expr = ["X11 AND (GPL-2.0-only WITH Classpath-exception-2.0 OR MIT)"]
+    outbounds = [outbound for outbound in arbiter.supported_licenses()
+                 if arbiter.inbounds_outbound_check(outbound, expr)['compatibility'] == "Yes"]
+    assert arbiter.compatible_outbounds(expr) == outbounds
+    assert arbiter.compatible_outbounds(expr, ["MIT", "Apache-2.0", "NONESUCH"]) == [o for o in outbounds if o in ["MIT", "Apache-2.0"]]
+
+
+def test_license_nodes_shared(parser):
+    parsed = parser.parse_license(["(X11 OR (MIT AND Zlib)) AND (BSD-3-Clause OR (MIT AND Zlib))"])
+    nodes = parser.license_nodes(parsed['simplified'])
+    assert nodes.to_dict() == parser._expression_to_tree(parsed['simplified'])
+    shared = [operand.operands[1] for operand in nodes.operands]
+    assert shared[0].to_dict() == {
+        "type": "operator",
+        "name": "AND",
+        "operands": [{"type": "license", "name": "MIT"}, {"type": "license", "name": "Zlib"}],
+    }
+    assert shared[0] is shared[1]
+
+
+@pytest.mark.parametrize('lic_expr', [
+    'MIT',
+    'GPL-2.0-only WITH Classpath-exception-2.0',
+    'X11 or MIT OR X11',
+    'MIT AND GPL-2.0-only with Classpath-exception-2.0 AND BSD-3-Clause',
+])
+def test_simple_expression(parser, lic_expr):
+    simple = parser._parse_simple(lic_expr)
+    simplified = parser.licensing.parse(lic_expr).simplify()
+    assert str(simple) == str(simplified)
+    assert parser._expression_to_tree(simple) == parser._expression_to_tree(simplified)
+
+
+@pytest.mark.parametrize('lic_expr', ['MIT OR', 'MIT WITH', 'MIT X11', '( MIT )', 'MIT AND X11 OR BSD-3-Clause'])
+def test_not_simple_expression(parser, lic_expr):
+    assert parser._parse_simple(lic_expr) is None
+
+
+def test_known_licenses(parser):
+    assert LicenseParserFactory.get_parser() is LicenseParserFactory.get_parser()
+    parsed = parser.parse_license(['mit OR Foo WITH Classpath-exception-2.0'])
+    assert parsed['unknown'] == ['Foo']
+    assert parsed['license']['operands'][1]['name'] == 'MIT'
+    assert parser.parse_license(['(mit OR Foo) AND (zlib OR bar)'])['unknown'] == ['Foo', 'bar']
+    assert set(parser.licenses('(mit OR Foo) AND (zlib OR bar)')) == {'Foo', 'MIT', 'Zlib', 'bar'}
+
+
+def test_compatible_license_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(flict_config, 'DEFAULT_CACHE_DIR', str(tmp_path))
+    compatible_license_cache.clear()
+    compat = compatible_license('GPL-2.0-or-later OR MIT')
+    assert compatible_license('GPL-2.0-or-later OR MIT') == compat
+    assert compatible_license_cache.statistics()['hits'] == 1
+
+    # a new process finds the result on disk
+    cache_files = list(tmp_path.glob('flame-*.json'))
+    assert len(cache_files) == 1
+    write_cache(cache_files[0].stem, {**compat, 'compat_license': 'MIT'}, str(tmp_path))
+    compatible_license_cache.clear()
+    assert compatible_license('GPL-2.0-or-later OR MIT')['compat_license'] == 'MIT'
+    assert compatible_license('GPL-2.0-or-later OR MIT', update_dual=False) != compatible_license('GPL-2.0-or-later OR MIT')
+    compatible_license_cache.clear()
+
+
+@pytest.mark.parametrize('spellings', [
+    ['GPL-2.0-only with Classpath-exception-2.0', 'GPL-2.0-only WITH Classpath-exception-2.0'],
+    ['GPL-2.0-only WITH Classpath-exception-2.0', 'GPL-2.0-only with Classpath-exception-2.0'],
+    ['MIT AND (X11 OR GPL-2.0-only with\tClasspath-exception-2.0)', 'MIT AND (X11 OR GPL-2.0-only WITH Classpath-exception-2.0)'],
+    ['MIT AND (X11 OR GPL-2.0-only WITH Classpath-exception-2.0)', 'MIT AND (X11 OR GPL-2.0-only With Classpath-exception-2.0)'],
+])
+def test_licenses_with_case(spellings):
+    license_cache.clear()
+    lic = License()
+    expected = set(lic.licenses(spellings[0].replace("\t", " ").replace(" with ", " WITH ").replace(" With ", " WITH ")))
+    license_cache.clear()
+    for expr in spellings:
+        assert set(lic.licenses(expr)) == expected
+    assert 'GPL-2.0-only WITH Classpath-exception-2.0' in expected
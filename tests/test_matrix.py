@@ -0,0 +1,157 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+
+import osadl_matrix
+import pytest
+
+from flict.flictlib.compatibility import CompatibilityFactory
+from flict.flictlib.matrix import CompatibilityMatrix
+from flict.flictlib.matrix import is_compiled_matrix
+from flict.flictlib.matrix import load_matrix
+from flict.flictlib.matrix import MATRIX_NO, MATRIX_UNDEFINED, MATRIX_YES
+from flict.flictlib.matrix import text_to_code
+from flict.flictlib.matrix import validate_matrix_data
+from flict.flictlib.return_codes import FlictError, ReturnCodes
+
+matrix_file = "tests/mini-matrix.json"
+
+
+def test_same_as_osadl_matrix():
+    matrix = load_matrix()
+    supported = list(osadl_matrix.supported_licenses())
+    assert matrix.licenses == supported
+    for outbound in supported:
+        for inbound in supported:
+            osadl_compat = osadl_matrix.get_compatibility(outbound, inbound)
+            assert matrix.code(outbound, inbound) == text_to_code(osadl_compat.value)
+
+
+def test_load_once():
+    assert load_matrix(matrix_file) is load_matrix(matrix_file)
+
+
+def test_mini_matrix():
+    matrix = load_matrix(matrix_file)
+    assert matrix.size == 3
+    assert matrix.code("BSD-3-Clause", "BSD-3-Clause") == MATRIX_YES
+    assert matrix.code("Dummy", "BSD-3-Clause") == MATRIX_NO
+    assert matrix.code("Dummy", "NONESUCH") == MATRIX_UNDEFINED
+
+
+def test_missing_cell():
+    matrix = CompatibilityMatrix.from_data({
+        "MIT": {"MIT": "Same"},
+        "X11": {"X11": "Same", "MIT": "Yes"},
+    })
+    assert matrix.code("MIT", "X11") == MATRIX_UNDEFINED
+    assert matrix.code("X11", "MIT") == MATRIX_YES
+
+
+def test_default_no_without_overlays(tmp_path):
+    license_db = tmp_path / "matrix.json"
+    license_db.write_text(json.dumps({
+        "MIT": {"MIT": "Same"},
+        "X11": {"X11": "Same", "MIT": "Yes"},
+    }))
+    assert load_matrix(str(license_db)).code("MIT", "X11") == MATRIX_UNDEFINED
+
+    matrix = load_matrix(str(license_db), default_no=True)
+    assert matrix.code("MIT", "X11") == MATRIX_NO
+    assert matrix.code("X11", "MIT") == MATRIX_YES
+
+    compatibility = CompatibilityFactory.get_compatibility(str(license_db), None, True)
+    assert compatibility.check_compat("MIT", "X11")['compatibility'] == "No"
+
+
+def test_check_compat_custom_db():
+    compatibility = CompatibilityFactory.get_compatibility(matrix_file)
+    assert compatibility.check_compat("GPL-2.0-or-later", "Dummy")['compatibility'] == "Yes"
+    assert compatibility.check_compat("Dummy", "GPL-2.0-or-later")['compatibility'] == "No"
+    assert compatibility.check_compat("Dummy", "MIT")['compatibility'] == "Unknown"
+    assert compatibility.check_compat("MIT", "Dummy")['compatibility'] == "Undefined"
+
+
+def test_compiled_matrix(tmp_path):
+    compiled_file = str(tmp_path / "matrix.bin")
+    matrix = load_matrix()
+    matrix.write_compiled(compiled_file)
+
+    assert is_compiled_matrix(compiled_file)
+    assert not is_compiled_matrix(matrix_file)
+
+    compiled = load_matrix(compiled_file)
+    assert compiled.licenses == matrix.licenses
+    assert compiled.meta == matrix.meta
+    assert bytes(compiled.codes) == bytes(matrix.codes)
+    assert compiled.code("GPL-2.0-only", "MIT") == MATRIX_YES
+
+
+def test_compiled_matrix_bad_version(tmp_path):
+    compiled_file = tmp_path / "matrix.bin"
+    load_matrix(matrix_file).write_compiled(str(compiled_file))
+    data = bytearray(compiled_file.read_bytes())
+    data[8] = 99
+    compiled_file.write_bytes(bytes(data))
+
+    with pytest.raises(FlictError) as _error:
+        CompatibilityMatrix.from_compiled_file(str(compiled_file))
+    assert _error.value.args[0] == ReturnCodes.RET_INVALID_MATRIX
+
+
+
+@pytest.mark.parametrize("size", [0, 10, -1])
+def test_compiled_matrix_truncated(tmp_path, size):
+    compiled_file = tmp_path / "matrix.bin"
+    load_matrix(matrix_file).write_compiled(str(compiled_file))
+    data = compiled_file.read_bytes()
+    compiled_file.write_bytes(data[:size])
+
+    with pytest.raises(FlictError) as _error:
+        CompatibilityMatrix.from_compiled_file(str(compiled_file))
+    assert _error.value.args[0] == ReturnCodes.RET_INVALID_MATRIX
+
+def test_bitsets():
+    matrix = load_matrix(matrix_file)
+    bsd = matrix.license_id("BSD-3-Clause")
+    dummy = matrix.license_id("Dummy")
+    gpl = matrix.license_id("GPL-2.0-or-later")
+
+    assert matrix.bits_licenses(matrix.inbound_bits(bsd)) == ["BSD-3-Clause", "Dummy"]
+    assert matrix.bits_licenses(matrix.outbound_bits(dummy)) == ["BSD-3-Clause", "Dummy", "GPL-2.0-or-later"]
+    assert matrix.outbound_bits(gpl) == matrix.license_bits(["GPL-2.0-or-later"])
+    assert matrix.license_bits(["NONESUCH"]) == 0
+
+
+def test_compatible_outbounds():
+    compatibility = CompatibilityFactory.get_compatibility()
+    outbounds = compatibility.bits_licenses(compatibility.compatible_outbounds(["MIT", "GPL-2.0-only"]))
+    assert "GPL-2.0-only" in outbounds
+    assert "MIT" not in outbounds
+    for outbound in outbounds:
+        assert compatibility.check_compat(outbound, "MIT")['compatibility'] == "Yes"
+        assert compatibility.check_compat(outbound, "GPL-2.0-only")['compatibility'] == "Yes"
+    assert compatibility.compatible_outbounds(["MIT", "NONESUCH"]) == 0
+
+
+def test_validate_matrix_data():
+    report = validate_matrix_data({
+        "timestamp": "",
+        "MIT": {"MIT": "Same", "X11": "Yes", "Proprietary": "No"},
+        "X11": {"X11": "Same"},
+        "BSD-3-Clause": {"MIT": "Yes", "X11": "Yes", "BSD-3-Clause": "Same"},
+    })
+    assert not report['valid']
+    assert report['licenses'] == 3
+    assert report['missing_cells'] == 3
+    assert report['missing'] == {"MIT": ["BSD-3-Clause"], "X11": ["BSD-3-Clause", "MIT"]}
+    assert report['not_in_matrix'] == {"MIT": ["Proprietary"]}
+
+
+def test_validate_osadl_matrix():
+    compatibility = CompatibilityFactory.get_compatibility()
+    report = compatibility.validate_license_db()
+    assert report['valid']
+    assert report['missing'] == {}
@@ -8,6 +8,9 @@ import pytest
 from flict.impl import FlictImpl
 from tests.args_mock import ArgsMock
 from flict.flictlib.return_codes import FlictError, ReturnCodes
+from flict.flictlib.matrix import CompatibilityMatrix
+from flict.flictlib.matrix import load_matrix
+from flict.flictlib.matrix import MATRIX_NO, MATRIX_UNDEFINED, MATRIX_YES
 
 matrix_file = "tests/mini-matrix.json"
 complete_addition_file = "tests/complete-lic-ext.json"
@@ -45,3 +48,28 @@ def _check_compat(expr):
     candidate = impl.suggest_outbound_candidate()
     return candidate
         
+
+def _merged_and_layered(orig_matrix, additional_matrix, default_no=False):
+    merged = CompatibilityMatrix.from_data(json.loads(_test_expression(orig_matrix, additional_matrix, default_no)))
+    layered = load_matrix(orig_matrix, [additional_matrix], default_no)
+    return merged, layered
+
+def test_overlay_same_as_merge():
+    for additional_matrix, default_no in [(complete_addition_file, False), (incomplete_addition_file, True)]:
+        merged, layered = _merged_and_layered(matrix_file, additional_matrix, default_no)
+        assert set(merged.licenses) == set(layered.licenses)
+        for outbound in merged.licenses:
+            for inbound in merged.licenses:
+                assert merged.code(outbound, inbound) == layered.code(outbound, inbound)
+
+def test_overlay_default_undefined():
+    layered = load_matrix(matrix_file, [incomplete_addition_file])
+    assert layered.code("Proprietary", "BSD-3-Clause") == MATRIX_YES
+    assert layered.code("Proprietary", "Dummy") == MATRIX_UNDEFINED
+    assert layered.code("Dummy", "BSD-3-Clause") == MATRIX_NO
+
+def test_overlay_suggest_outbound():
+    args = ArgsMock(license_matrix_file=matrix_file,
+                    license_matrix_overlay_files=[complete_addition_file],
+                    license_expression=['Proprietary'])
+    assert json.loads(FlictImpl(args).suggest_outbound_candidate()) == ['Proprietary']
@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2024 Henrik Sandklef
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+
+from flict.impl import FlictImpl
+from flict.flictlib.license import compatible_license_short
+from flict.flictlib.license import normalize_licenses
+from flict.flictlib.project.reader import ProjectReaderFactory
+from tests.args_mock import ArgsMock
+
+
+def test_normalize_licenses():
+    licenses = ['GPLv2+', 'MIT', 'GPLv2+', 'BSD3 and zlib']
+    normalized = normalize_licenses(licenses)
+    assert list(normalized) == ['GPLv2+', 'MIT', 'BSD3 and zlib']
+    for lic in licenses:
+        assert normalized[lic] == compatible_license_short(lic)
+
+
+def test_normalize_command():
+    args = ArgsMock(license_expression=['MIT', 'GPLv2+', 'MIT'], output_format="JSON")
+    normalized = json.loads(FlictImpl(args).normalize())
+    assert [item['original'] for item in normalized] == ['MIT', 'GPLv2+', 'MIT']
+    assert [item['normalized'] for item in normalized] == [compatible_license_short(lic) for lic in ['MIT', 'GPLv2+', 'MIT']]
+
+
+def test_prepare_project():
+    reader = ProjectReaderFactory.get_projectreader(project_format="flict")
+    project = reader.prepare_project({
+        'packages': [
+            {'name': 'a', 'license': 'MIT', 'dependencies': [{'name': 'dep', 'license': 'GPLv2+', 'dependencies': []}, {'name': 'dep2', 'license': 'GPLv2+', 'dependencies': []}]},
+        ],
+    })
+    package = project['packages'][0]
+    assert package['original_license'] == 'MIT'
+    assert package['license'] == compatible_license_short('MIT')
+    for dep in package['dependencies']:
+        assert dep['original_license'] == 'GPLv2+'
+        assert dep['license'] == compatible_license_short('GPLv2+')
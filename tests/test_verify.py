@@ -9,6 +9,9 @@ from jsonschema import validate
 import unittest
 from flict.flictlib.arbiter import Arbiter
 from flict.flictlib.project.reader import ProjectReaderFactory
+from flict.flictlib.utils import outbound_compatibility
+from flict.impl import FlictImpl
+from tests.args_mock import ArgsMock
 
 
 class TestVerification(unittest.TestCase):
@@ -131,6 +134,136 @@ class TestVerification(unittest.TestCase):
             elif pkg['name'] == 'SPDXRef-Package-zlib':
                 self.assertEqual(len(pkg['dependencies']), 1)
 
+    def test_short_circuit_verification(self):
+        reader = ProjectReaderFactory.get_projectreader(project_format="flict")
+        project = reader.read_project("example-data/europe-small.json")
+
+        verification = self.arbiter.verify(project)
+        short_circuit = Arbiter(short_circuit=True).verify(project)
+
+        self.__validate(short_circuit)
+        for package, short_package in zip(verification['packages'], short_circuit['packages']):
+            self.assertEqual(package['outbound_licenses'], short_package['outbound_licenses'])
+            self.assertEqual(package['outbound_license'], short_package['outbound_license'])
+            for dep, short_dep in zip(package['dependencies'], short_package['dependencies']):
+                self.assertEqual([compat['compatibility'] for compat in dep['compatibility']],
+                                 [compat['compatibility'] for compat in short_dep['compatibility']])
+
+        # Apache-2.0 OR GPL-2.0-only OR ..., checked against Apache-2.0
+        compats = short_circuit['packages'][0]['dependencies'][0]['compatibility']
+        operands = [compat for compat in compats if compat['outbound']['name'] == "Apache-2.0"][0]['operands']
+        self.assertEqual([operand['compatibility'] for operand in operands], ["Yes", "Not evaluated", "Not evaluated", "Not evaluated"])
+
+    def test_shared_dependency_checks(self):
+        reader = ProjectReaderFactory.get_projectreader(project_format="flict")
+        deps = [{'name': name, 'version': '1', 'license': lic, 'dependencies': []}
+                for name, lic in [('a', 'MIT'), ('b', 'GPL-2.0-only'), ('c', 'MIT')]]
+        project = reader.read_project_data({'project': {'name': 'p', 'version': '1', 'license': 'MIT OR GPL-2.0-only', 'dependencies': deps}})
+
+        verification = self.arbiter.verify(project)
+        self.__validate(verification)
+
+        package = verification['packages'][0]
+        licenses = package['dependencies'][0]['licenses_to_check']
+        for dep in package['dependencies']:
+            self.assertEqual(dep['compatibility'], self.arbiter._verify_package(dep, licenses)[0])
+        self.assertEqual(package['outbound_licenses'], ['GPL-2.0-only'])
+
+    def test_compatibility_index(self):
+        reader = ProjectReaderFactory.get_projectreader(project_format="flict")
+        project = reader.read_project("example-data/europe-small.json")
+
+        verification = self.arbiter.verify(project)
+        self.__validate(verification)
+
+        dep = verification['packages'][0]['dependencies'][0]
+        for outbound in dep['licenses_to_check']:
+            compat = outbound_compatibility(dep, outbound)
+            self.assertEqual(compat['outbound']['name'], outbound)
+            # reports without index, e.g. from older versions
+            unindexed = {key: value for key, value in dep.items() if key != 'compatibility_index'}
+            self.assertIs(outbound_compatibility(unindexed, outbound), compat)
+        self.assertIsNone(outbound_compatibility(dep, "NONESUCH"))
+
+    def test_parallel_verification(self):
+        licenses = ['MIT', 'GPL-2.0-only', 'Apache-2.0', 'BSD-3-Clause OR GPL-3.0-only', 'LGPL-2.1-or-later']
+        project = {
+            'project_name': 'parallel',
+            'packages': [{
+                'name': f'package-{index}',
+                'version': '1',
+                'license': licenses[index % len(licenses)],
+                'dependencies': [{'name': f'dep-{index}-{lic}', 'version': '1', 'license': lic, 'dependencies': []} for lic in licenses[:index % 4]],
+            } for index in range(10)],
+        }
+
+        verification = self.arbiter.verify(project)
+        parallel = Arbiter(jobs=3).verify(project)
+
+        for report in [verification, parallel]:
+            report.pop('meta')
+            report['all_licenses'].sort()
+        self.assertEqual(verification, parallel)
+
+    def test_previous_verification(self):
+        def _project(licenses):
+            return {
+                'project_name': 'previous',
+                'packages': [{
+                    'name': f'package-{index}',
+                    'version': '1',
+                    'license': lic,
+                    'dependencies': [{'name': f'dep-{index}', 'version': '1', 'license': 'MIT', 'dependencies': []}],
+                } for index, lic in enumerate(licenses)],
+            }
+
+        previous = self.arbiter.verify(_project(['MIT', 'GPL-2.0-only', 'Apache-2.0']))
+        self.assertEqual(previous['meta']['matrix_digest'], self.arbiter.verification_digests()['matrix_digest'])
+
+        project = _project(['MIT', 'BSD-3-Clause', 'Apache-2.0'])
+        project['packages'][2]['dependencies'].append({'name': 'new-dep', 'version': '1', 'license': 'MIT', 'dependencies': []})
+        verification = self.arbiter.verify(project, previous=previous)
+
+        # only the unchanged package is copied
+        packages = verification['packages']
+        self.assertIs(packages[0], previous['packages'][0])
+        self.assertIsNot(packages[1], previous['packages'][1])
+        self.assertIsNot(packages[2], previous['packages'][2])
+        self.assertEqual(packages[1]['license'], 'BSD-3-Clause')
+        self.assertEqual(len(packages[2]['dependencies']), 2)
+
+        full = self.arbiter.verify(project)
+        for report in [verification, full]:
+            report.pop('meta')
+            report['all_licenses'].sort()
+        self.assertEqual(verification, full)
+
+        # another policy, nothing is copied
+        denied = Arbiter(denied_licenses=['MIT']).verify(project, previous=previous)
+        self.assertIsNot(denied['packages'][0], previous['packages'][0])
+        self.assertEqual(denied['packages'][0]['allowed_outbound_licenses'], [])
+
+    def test_verify_verdict(self):
+        reader = ProjectReaderFactory.get_projectreader(project_format="flict")
+        for project_file in ["example-data/europe-small.json", "example-data/europe.json", "example-data/cairo-pile-flict.json"]:
+            project = reader.read_project(project_file)
+            for arbiter in [self.arbiter, Arbiter(short_circuit=True), Arbiter(denied_licenses=['GPL-3.0-only'])]:
+                verification = arbiter.verify(project)
+                problems = {problem for package in verification['packages'] for problem in package['problems'] + package['dependency_problems']}
+                compatible = all(package['allowed_outbound_licenses'] for package in verification['packages'])
+
+                self.assertEqual(arbiter.verify_verdict(project, check_problems=False), {'compatible': compatible, 'problems': []})
+                verdict = arbiter.verify_verdict(project)
+                self.assertEqual(bool(verdict['problems']), bool(problems))
+                self.assertTrue(set(verdict['problems']) <= problems)
+                if not problems:
+                    self.assertEqual(verdict['compatible'], compatible)
+
+    def test_quick_verification(self):
+        for project_file in ["example-data/europe-small.json", "example-data/europe.json"]:
+            data, code = FlictImpl(ArgsMock(verify_flict=project_file)).verify()
+            self.assertEqual(FlictImpl(ArgsMock(verify_flict=project_file, quick=True)).verify(), (None, code))
+
 if __name__ == '__main__':
     unittest.main()
     